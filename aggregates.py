@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+from budgets import BUCKET_COL
+
+# Everything the treemap and budget views group or filter purchases by
+CUBE_DIMENSIONS = [
+    "account_id",
+    "personal_finance_category.primary",
+    "merchant_name",
+    BUCKET_COL,
+]
+# What the trend chart shows per month, see AggregateCube.monthly_totals
+TREND_DIMENSIONS = CUBE_DIMENSIONS[:2]
+EMPTY_AGGREGATE = pd.DataFrame(columns=CUBE_DIMENSIONS + ["amount", "count"]).astype(
+    {BUCKET_COL: "int64", "amount": "int64", "count": "int64"}
+)
+
+
+def aggregate(rows: pd.DataFrame) -> pd.DataFrame:
+    """Sum (in cents) and count of amount per combination of CUBE_DIMENSIONS"""
+    agg = (
+        rows.groupby(CUBE_DIMENSIONS, observed=True, sort=False)["amount"]
+        .agg(["sum", "size"])
+        .rename(columns={"sum": "amount", "size": "count"})
+        .reset_index()
+    )
+    # Plain strings so frames built from differently categorized rows combine
+    return agg.astype({col: str for col in CUBE_DIMENSIONS[:-1]})
+
+
+class AggregateCube:
+    """Purchases pre-aggregated per Month over CUBE_DIMENSIONS
+
+    Views read a month's aggregate, whose size depends on the number of
+    distinct merchants rather than transactions. It is kept up to date by
+    adding or subtracting the rows that changed.
+
+    Every combination of CUBE_DIMENSIONS gets a number, so months (and other
+    aggregates) are summed with np.bincount instead of a groupby.
+    """
+
+    def __init__(self, purchases_df: pd.DataFrame):
+        self.months = {}
+        # Month -> amount per TREND_DIMENSIONS, small enough to chart many months
+        self.month_totals = {}
+        # Month -> combination number of each row of its aggregate
+        self.month_combinations = {}
+        # CUBE_DIMENSIONS values -> combination number, and the reverse as columns
+        self.combination_numbers = {}
+        self.combinations = [[] for _ in CUBE_DIMENSIONS]
+        self._combination_arrays = None
+        self.add(purchases_df)
+
+    def _numbers(self, agg: pd.DataFrame) -> np.ndarray:
+        """Combination number of each row of an aggregate, numbering new ones"""
+        numbers = []
+        for values in zip(*(agg[col] for col in CUBE_DIMENSIONS)):
+            number = self.combination_numbers.get(values)
+            if number is None:
+                number = self.combination_numbers[values] = len(
+                    self.combination_numbers
+                )
+                for combination, value in zip(self.combinations, values):
+                    combination.append(value)
+                self._combination_arrays = None
+            numbers.append(number)
+        return np.array(numbers, dtype="int64")
+
+    def add(self, rows: pd.DataFrame, sign: int = 1) -> None:
+        """Add rows' amounts and counts to the cube, or remove them with sign=-1"""
+        for month, month_rows in rows.groupby("Month", observed=True, sort=False):
+            delta = aggregate(month_rows)
+            delta[["amount", "count"]] *= sign
+            if month in self.months:
+                delta = (
+                    pd.concat([self.months[month], delta])
+                    .groupby(CUBE_DIMENSIONS, sort=False)[["amount", "count"]]
+                    .sum()
+                    .reset_index()
+                )
+                delta = delta[delta["count"] != 0].reset_index(drop=True)
+            self.months[month] = delta
+            self.month_combinations[month] = self._numbers(delta)
+            self.month_totals[month] = (
+                delta.groupby(TREND_DIMENSIONS, sort=False)["amount"]
+                .sum()
+                .reset_index()
+            )
+
+    def month(self, month) -> pd.DataFrame:
+        """The aggregate of one Month, shared so read-only"""
+        return self.months.get(month, EMPTY_AGGREGATE)
+
+    def monthly_totals(self, months) -> pd.DataFrame:
+        """Amount per Month and TREND_DIMENSIONS over several Months"""
+        frames = [
+            self.month_totals[month].assign(Month=month)
+            for month in months
+            if month in self.month_totals
+        ]
+        if not frames:
+            return pd.DataFrame(columns=["Month", *TREND_DIMENSIONS, "amount"])
+        return pd.concat(frames, ignore_index=True)
+
+    def total(self, months, others=()) -> pd.DataFrame:
+        """The aggregate of several Months plus other aggregates (of rows outside
+        those months)"""
+        months = [month for month in months if month in self.months]
+        others = [agg for agg in others if len(agg)]
+        if len(months) + len(others) <= 1:
+            return (
+                self.month(months[0]) if months else next(iter(others), EMPTY_AGGREGATE)
+            )
+
+        aggregates = [self.months[month] for month in months] + others
+        numbers = np.concatenate(
+            [self.month_combinations[month] for month in months]
+            + [self._numbers(agg) for agg in others]
+        )
+        size = len(self.combination_numbers)
+        amounts = np.bincount(
+            numbers,
+            np.concatenate([agg["amount"].to_numpy() for agg in aggregates]),
+            size,
+        )
+        counts = np.bincount(
+            numbers,
+            np.concatenate([agg["count"].to_numpy() for agg in aggregates]),
+            size,
+        )
+        present = np.flatnonzero(counts)
+        if self._combination_arrays is None:
+            self._combination_arrays = [
+                np.array(combination, dtype=object) for combination in self.combinations
+            ]
+        total = pd.DataFrame(
+            {
+                col: combination[present]
+                for col, combination in zip(CUBE_DIMENSIONS, self._combination_arrays)
+            }
+        )
+        # Sums of integers, exact as floats
+        total["amount"] = amounts[present].round().astype("int64")
+        total["count"] = counts[present].round().astype("int64")
+        return total.astype({BUCKET_COL: "int64"})
@@ -2,6 +2,7 @@ from flask import Flask
 from dashboard import create_dashboard
 from config import SECRET_KEY
 from auth import setup_auth
+from compression import setup_compression
 
 
 def create_app():
@@ -15,6 +16,9 @@ def create_app():
     # Create and configure dashboard
     create_dashboard(server)
 
+    # Compress responses (after_request, so it applies to Dash's routes too)
+    setup_compression(server)
+
     return server
 
 
@@ -0,0 +1,41 @@
+// Clientside callbacks for UI-only state, so they run in the browser without a
+// round trip to the server. Add new ones to the "ui" namespace and register them
+// with dash.clientside_callback(ClientsideFunction("ui", "<name>"), ...) in
+// dashboard.py. Anything that needs the data stays a server callback.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    ui: {
+        // Collapse a section on odd clicks: [className, button label]
+        toggleMinimized: function (n_clicks) {
+            if (n_clicks % 2 === 1) {
+                return ["minimized", "+"];
+            }
+            return ["", "−"]; // Unicode minus sign
+        },
+
+        // Close the edit modal. Its inputs keep their values, the save callback
+        // reads them from the same click
+        closeModal: function () {
+            return false;
+        },
+
+        // The timespan (see timespans.py) from the dropdown, or the picked dates
+        // as "start/end" for a custom range, and the picker's style to only show
+        // it for a custom range
+        timespan: function (selection, start, end, current, style) {
+            const custom = selection === "Custom Range";
+            style = Object.assign({}, style, {display: custom ? "block" : "none"});
+            let timespan = selection;
+            if (custom) {
+                if (!start || !end) {
+                    timespan = current;
+                } else {
+                    timespan = start.slice(0, 10) + "/" + end.slice(0, 10);
+                }
+            }
+            if (timespan === current) {
+                return [window.dash_clientside.no_update, style];
+            }
+            return [timespan, style];
+        },
+    },
+});
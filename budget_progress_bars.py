@@ -1,10 +1,13 @@
-from dash import html, dcc
+from dash import html, dcc, Patch, no_update
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
-from config import NON_EXTRA_CATEGORIES, CATEGORY_COLOR
+from config import CATEGORY_COLOR, BUDGET_RENDERER
+from budgets import bucket_totals
 
 
-def create_budget_progress_bar(category, spent_amount, budget_amount, color):
+def create_budget_progress_bar(
+    category, spent_amount, budget_amount, color, forecast=None
+):
     """
     Create a horizontal progress bar showing budget usage
 
@@ -13,6 +16,8 @@ def create_budget_progress_bar(category, spent_amount, budget_amount, color):
         spent_amount: Amount spent in the category
         budget_amount: Budget limit for the category
         color: Color for the progress bar
+        forecast: (projected spend, on pace) of the category, see
+            forecast.forecast_budgets, for the current month
 
     Returns:
         Dash component with the progress bar
@@ -23,62 +28,9 @@ def create_budget_progress_bar(category, spent_amount, budget_amount, color):
     )
     is_over_budget = amount_left < 0
 
-    # Create the plotly figure for the progress bar
-    fig = go.Figure()
-
-    # Add the background bar (full budget)
-    fig.add_trace(
-        go.Bar(
-            x=[budget_amount],
-            y=[category],
-            orientation="h",
-            marker=dict(color="lightgray", opacity=0.3),
-            showlegend=False,
-            hoverinfo="skip",
-            width=0.6,
-        )
-    )
-
-    # Add the progress bar (spent amount)
     progress_color = "red" if is_over_budget else color
-    fig.add_trace(
-        go.Bar(
-            x=[amount_left if amount_left > 0 else 0],
-            y=[category],
-            orientation="h",
-            marker=dict(color=progress_color, opacity=0.8),
-            showlegend=False,
-            hovertemplate=f"<b>{category}</b><br>"
-            + f"Spent: ${spent_amount:,.2f}<br>"
-            + f"Budget: ${budget_amount:,.2f}<br>"
-            + f"Remaining: ${amount_left:,.2f}<br>"
-            + "<extra></extra>",
-            width=0.6,
-        )
-    )
-
-    # Update layout for clean appearance
-    fig.update_layout(
-        height=60,
-        width=None,  # Allow width to be responsive
-        autosize=True,
-        margin=dict(l=0, r=0, t=10, b=10, autoexpand=False),
-        xaxis=dict(
-            showgrid=False,
-            showticklabels=False,
-            zeroline=False,
-            range=[0, max(budget_amount * 1.1, spent_amount * 1.1)],
-            fixedrange=True,  # Prevent zoom
-        ),
-        yaxis=dict(
-            showgrid=False,
-            showticklabels=False,
-            zeroline=False,
-            fixedrange=True,  # Prevent zoom
-        ),
-        plot_bgcolor="white",
-        paper_bgcolor="white",
-        barmode="overlay",
+    progress = BAR_RENDERERS[BUDGET_RENDERER](
+        category, spent_amount, budget_amount, progress_color
     )
 
     # Format the text display
@@ -146,15 +98,8 @@ def create_budget_progress_bar(category, spent_amount, budget_amount, color):
                     ],
                     className="mb-2",
                 ),
-                dcc.Graph(
-                    figure=fig,
-                    config={
-                        "displayModeBar": False,
-                        "staticPlot": True,
-                        "responsive": True,
-                    },
-                    style={"height": "60px", "width": "100%"},
-                ),
+                progress,
+                *([] if forecast is None else [_forecast_line(*forecast)]),
             ],
             className="p-3",
         ),
@@ -162,14 +107,136 @@ def create_budget_progress_bar(category, spent_amount, budget_amount, color):
     )
 
 
-def create_budget_section(purchases_df, budgets):
+def _forecast_line(projected, on_pace):
+    return html.Small(
+        [
+            f"Projected ${projected:,.2f} by month end · ",
+            html.Span(
+                "On pace" if on_pace else "Over pace",
+                style={"color": "green" if on_pace else "red", "fontWeight": "600"},
+            ),
+        ],
+        className="text-muted",
+    )
+
+
+def _progress_figure(category, spent_amount, budget_amount, progress_color):
+    """Progress bar as its own plotly figure"""
+    amount_left = budget_amount - spent_amount
+
+    # Create the plotly figure for the progress bar
+    fig = go.Figure()
+
+    # Add the background bar (full budget)
+    fig.add_trace(
+        go.Bar(
+            x=[budget_amount],
+            y=[category],
+            orientation="h",
+            marker=dict(color="lightgray", opacity=0.3),
+            showlegend=False,
+            hoverinfo="skip",
+            width=0.6,
+        )
+    )
+
+    # Add the progress bar (spent amount)
+    fig.add_trace(
+        go.Bar(
+            x=[amount_left if amount_left > 0 else 0],
+            y=[category],
+            orientation="h",
+            marker=dict(color=progress_color, opacity=0.8),
+            showlegend=False,
+            hovertemplate=f"<b>{category}</b><br>"
+            + f"Spent: ${spent_amount:,.2f}<br>"
+            + f"Budget: ${budget_amount:,.2f}<br>"
+            + f"Remaining: ${amount_left:,.2f}<br>"
+            + "<extra></extra>",
+            width=0.6,
+        )
+    )
+
+    # Update layout for clean appearance
+    fig.update_layout(
+        height=60,
+        width=None,  # Allow width to be responsive
+        autosize=True,
+        margin=dict(l=0, r=0, t=10, b=10, autoexpand=False),
+        xaxis=dict(
+            showgrid=False,
+            showticklabels=False,
+            zeroline=False,
+            range=[0, max(budget_amount * 1.1, spent_amount * 1.1)],
+            fixedrange=True,  # Prevent zoom
+        ),
+        yaxis=dict(
+            showgrid=False,
+            showticklabels=False,
+            zeroline=False,
+            fixedrange=True,  # Prevent zoom
+        ),
+        plot_bgcolor="white",
+        paper_bgcolor="white",
+        barmode="overlay",
+    )
+
+    return dcc.Graph(
+        figure=fig,
+        config={
+            "displayModeBar": False,
+            "staticPlot": True,
+            "responsive": True,
+        },
+        style={"height": "60px", "width": "100%"},
+    )
+
+
+def _progress_html(category, spent_amount, budget_amount, progress_color):
+    """Progress bar as plain HTML/CSS, laid out like _progress_figure's bars but
+    without a figure for the browser to render"""
+    amount_left = budget_amount - spent_amount
+    axis_max = max(budget_amount * 1.1, spent_amount * 1.1) or 1
+    bar_style = {"position": "absolute", "top": 0, "left": 0, "height": "100%"}
+    return html.Div(
+        [
+            # Background bar (full budget)
+            html.Div(
+                style={
+                    **bar_style,
+                    "width": f"{budget_amount / axis_max * 100:.2f}%",
+                    "backgroundColor": "lightgray",
+                    "opacity": 0.3,
+                }
+            ),
+            # Progress bar (amount left)
+            html.Div(
+                style={
+                    **bar_style,
+                    "width": f"{max(amount_left, 0) / axis_max * 100:.2f}%",
+                    "backgroundColor": progress_color,
+                    "opacity": 0.8,
+                }
+            ),
+        ],
+        title=f"{category}\nSpent: ${spent_amount:,.2f}\n"
+        + f"Budget: ${budget_amount:,.2f}\nRemaining: ${amount_left:,.2f}",
+        style={"position": "relative", "height": "24px", "margin": "18px 0"},
+    )
+
+
+BAR_RENDERERS = {"html": _progress_html, "plotly": _progress_figure}
+
+
+def create_budget_section(purchases_df, budgets, forecasts=None):
     """
     Create a section with budget progress bars for specified categories
 
     Args:
-        purchases_df: DataFrame with purchase data
-        month_name: Selected month name
+        purchases_df: DataFrame with purchase data, or its aggregate (see
+            aggregates.aggregate), with a budgets.BUCKET_COL column
         budgets: Dictionary with category budgets
+        forecasts: Forecast per category (see create_budget_progress_bar), if any
 
     Returns:
         Dash component with all budget progress bars
@@ -178,31 +245,11 @@ def create_budget_section(purchases_df, budgets):
     # Define colors for each category (matching your existing color scheme)
     progress_bars = []
 
+    # amount is stored in cents
+    spent_amounts = bucket_totals(purchases_df)
+
     for category in budgets.keys():
-        # Calculate spent amount for this category
-        if category == "Total":
-            category_data = purchases_df
-        elif category == "Groceries":
-            category_data = purchases_df[
-                (
-                    purchases_df["personal_finance_category.primary"]
-                    == "GENERAL_MERCHANDISE"
-                )
-                & purchases_df["name"].str.contains(
-                    "Walmart|Aldi", case=False, regex=True
-                )
-            ]
-        elif category == "Extras":
-            category_data = purchases_df[
-                ~purchases_df["personal_finance_category.primary"].isin(
-                    NON_EXTRA_CATEGORIES
-                )
-            ]
-        else:
-            category_data = purchases_df[
-                purchases_df["personal_finance_category.primary"] == category
-            ]
-        spent_amount = category_data["amount"].sum() if not category_data.empty else 0
+        spent_amount = spent_amounts[category] / 100
 
         budget_amount = budgets.get(category, 0)
 
@@ -211,7 +258,11 @@ def create_budget_section(purchases_df, budgets):
 
         # Create progress bar
         progress_bar = create_budget_progress_bar(
-            category, spent_amount, budget_amount, color
+            category,
+            spent_amount,
+            budget_amount,
+            color,
+            (forecasts or {}).get(category),
         )
         progress_bars.append(progress_bar)
 
@@ -229,3 +280,46 @@ def create_budget_section(purchases_df, budgets):
         ],
         className="mb-5",
     )
+
+
+def patch_budget_section(
+    before_df, after_df, budgets, before_forecasts=None, after_forecasts=None
+):
+    """
+    Update a section made by create_budget_section, replacing only the progress
+    bars whose spent amount or forecast changed
+
+    Args:
+        before_df: What the section was created from
+        after_df: What the section should show
+        budgets: Dictionary with category budgets
+        before_forecasts: Forecasts the section was created with
+        after_forecasts: Forecasts the section should show
+
+    Returns:
+        dash.Patch for the section, or dash.no_update if nothing changed
+    """
+    before = bucket_totals(before_df)
+    after = bucket_totals(after_df)
+
+    section = Patch()
+    # Container > Row > Col > progress bars
+    progress_bars = section["props"]["children"][0]["props"]["children"][0]["props"][
+        "children"
+    ]
+    before_forecasts = before_forecasts or {}
+    after_forecasts = after_forecasts or {}
+    changed = False
+    for i, category in enumerate(budgets.keys()):
+        if before[category] != after[category] or before_forecasts.get(
+            category
+        ) != after_forecasts.get(category):
+            progress_bars[i] = create_budget_progress_bar(
+                category,
+                after[category] / 100,
+                budgets.get(category, 0),
+                CATEGORY_COLOR.get(category, "darkgray"),
+                after_forecasts.get(category),
+            )
+            changed = True
+    return section if changed else no_update
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from config import BUDGET_BUCKETS, CATEGORY_BUDGETS, INDIVIDUAL_BUDGETS
+from overrides_helpers import CATEGORY_COL
+
+# Bitmask of the budgets each transaction counts towards
+BUCKET_COL = "budget_buckets"
+# Columns the bucket rules look at
+BUCKET_INPUTS = {CATEGORY_COL, "name"}
+
+BUCKETS = {
+    name: BUDGET_BUCKETS.get(name, {"categories": [name]})
+    for name in {**CATEGORY_BUDGETS, **INDIVIDUAL_BUDGETS}
+}
+BUCKET_BITS = {name: 1 << i for i, name in enumerate(BUCKETS)}
+
+
+def _matches(values: pd.Series, pattern) -> np.ndarray:
+    """Case-insensitive regex match, run once per category of a categorical"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        matched = values.cat.categories.str.contains(pattern, case=False, regex=True)
+        # Missing values have code -1, which picks the trailing False
+        return np.append(matched, False)[values.cat.codes.to_numpy()]
+    return values.str.contains(pattern, case=False, regex=True, na=False).to_numpy()
+
+
+def _rule_mask(df: pd.DataFrame, rule: dict) -> np.ndarray:
+    mask = np.ones(len(df), dtype=bool)
+    if "categories" in rule:
+        mask &= df[CATEGORY_COL].isin(rule["categories"]).to_numpy()
+    if "exclude_categories" in rule:
+        mask &= ~df[CATEGORY_COL].isin(rule["exclude_categories"]).to_numpy()
+    if "name_pattern" in rule:
+        mask &= _matches(df["name"], rule["name_pattern"])
+    return mask
+
+
+def bucket_mask(df: pd.DataFrame) -> np.ndarray:
+    """The BUCKET_COL values of df's transactions"""
+    mask = np.zeros(len(df), dtype="int64")
+    for name, rule in BUCKETS.items():
+        mask[_rule_mask(df, rule)] |= BUCKET_BITS[name]
+    return mask
+
+
+def bucket_totals(rows: pd.DataFrame) -> dict:
+    """Amount (in cents) per budget, of rows or their aggregate (see
+    aggregates.aggregate), with a single grouped sum"""
+    by_mask = rows.groupby(BUCKET_COL)["amount"].sum()
+    masks = by_mask.index.to_numpy()
+    return {
+        name: int(by_mask.to_numpy()[(masks & bit) != 0].sum())
+        for name, bit in BUCKET_BITS.items()
+    }
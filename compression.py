@@ -0,0 +1,72 @@
+import gzip
+from flask import request
+from view_cache import LRUCache
+from config import COMPRESS_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is used without it
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+}
+# Compressed bodies of responses with an ETag (the layout, Dash's bundles), which
+# are the same for every request
+compressed_bodies = LRUCache(64)
+
+
+def _accepted_encoding():
+    """Best encoding the browser accepts, or None"""
+    if brotli is not None and request.accept_encodings["br"]:
+        return "br"
+    if request.accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data: bytes, encoding) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_response(response):
+    """Compress responses of at least COMPRESS_MIN_SIZE bytes, e.g. callback
+    outputs carrying figures and tables"""
+    if (
+        response.status_code != 200
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+    # Files (e.g. from assets/) are streamed otherwise, they are small text files
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    etag, _ = response.get_etag()
+    if etag is None:
+        body = _compress(data, encoding)
+    else:
+        body = compressed_bodies.get_or_compute(
+            (request.path, etag, encoding), lambda: _compress(data, encoding)
+        )
+    response.set_data(body)
+    # The ETag is kept so revalidation still gets a 304, Vary tells caches the
+    # body depends on Accept-Encoding
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def setup_compression(server):
+    server.after_request(compress_response)
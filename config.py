@@ -6,6 +6,17 @@ DATA_DIR = os.environ.get("DATA_DIR")
 
 MAIN_DATA_LOC = DATA_DIR + "/transactions.csv"
 OVERRIDES_LOC = DATA_DIR + "/overrides.csv"
+# "csv" keeps edits in OVERRIDES_LOC, "sqlite" in OVERRIDES_DB_LOC (imported from
+# OVERRIDES_LOC on first use, export back with `python overrides_helpers.py`)
+OVERRIDES_BACKEND = os.environ.get("OVERRIDES_BACKEND", "csv")
+OVERRIDES_DB_LOC = DATA_DIR + "/overrides.sqlite3"
+# Parsed/typed copies of the CSVs above, keyed by the source files' fingerprints
+CACHE_DIR = os.environ.get("CACHE_DIR", DATA_DIR + "/.cache")
+# Workers map one published copy of the loaded data instead of each loading their own.
+# Opt-in: every change to transactions.csv is then a full republish and remap,
+# rather than appending just the new rows
+SHARED_DATA_PLANE = os.environ.get("SHARED_DATA_PLANE", "0") == "1"
+DATA_PLANE_DIR = os.environ.get("DATA_PLANE_DIR", CACHE_DIR + "/data_plane")
 
 CATEGORY_BUDGETS = {
     "Total": 2500,
@@ -43,4 +54,49 @@ NON_EXTRA_CATEGORIES = [
     "MEDICAL",
 ]
 
+# Which purchases count towards each budget in CATEGORY_BUDGETS and
+# INDIVIDUAL_BUDGETS (a budget without an entry counts its own category).
+# Every rule is optional:
+# - categories: personal_finance_category.primary values to count
+# - exclude_categories: personal_finance_category.primary values not to count
+# - name_pattern: case-insensitive regex the transaction name has to match
+BUDGET_BUCKETS = {
+    "Total": {},
+    "Groceries": {
+        "categories": ["GENERAL_MERCHANDISE"],
+        "name_pattern": "Walmart|Aldi",
+    },
+    "Extras": {"exclude_categories": NON_EXTRA_CATEGORIES},
+}
+
 TRANSACTIONS_TABLE_PAGE_SIZE = 10
+# "html" pages through the table above with an edit button per row, "grid" shows a
+# virtualized grid that is paged, sorted and filtered on the server
+TRANSACTIONS_TABLE_MODE = os.environ.get("TRANSACTIONS_TABLE_MODE", "html")
+TRANSACTIONS_GRID_PAGE_SIZE = 250
+
+# How budget progress bars are drawn: "html" for plain HTML/CSS bars, "plotly" for
+# a (heavier) plotly figure per budget
+BUDGET_RENDERER = os.environ.get("BUDGET_RENDERER", "html")
+
+# Largest purchases listed when hovering a merchant in the treemap
+TREEMAP_HOVER_TOP_N = 3
+
+# Months the trend chart can show, the first is the default
+TREND_MONTHS = [12, 24, 36]
+
+# Number of filtered views (timespan, spender) kept per worker
+FILTERED_VIEW_CACHE_SIZE = 32
+
+# Rows written at a time by the /export/transactions route
+EXPORT_BATCH_ROWS = 10000
+
+# Responses of at least this many bytes are sent compressed to browsers that accept
+# it, with brotli if the brotli package is installed and otherwise gzip
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+# Seconds browsers may cache files from assets/, whose URLs change with the files
+ASSETS_MAX_AGE = 365 * 24 * 60 * 60
+
+# Seconds between checks of the data files for changes. With inotify (Linux) changes
+# are picked up as they happen and this is only the longest wait between checks
+DATA_WATCH_INTERVAL = float(os.environ.get("DATA_WATCH_INTERVAL", "5"))
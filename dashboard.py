@@ -8,24 +8,55 @@ from dash import (
     State,
     ALL,
     callback_context,
+    clientside_callback,
+    ClientsideFunction,
+    Patch,
+    no_update,
 )
 from dash.exceptions import PreventUpdate
-import plotly.express as px
+import flask
+import hashlib
+import numpy as np
 import pandas as pd
 import dash_bootstrap_components as dbc
 from overrides_helpers import upsert_override, delete_override
-from datafetchers import fetch_transaction_df_all, fetch_csv_last_modified
-from budget_progress_bars import create_budget_section
+from transaction_data import TransactionData
+from data_watcher import DataWatcher
+from view_cache import LRUCache
+from aggregates import EMPTY_AGGREGATE, aggregate
+from search_index import normalize_query
+from timespans import timespan_options, timespan_range, is_relative
+from budget_progress_bars import create_budget_section, patch_budget_section
+from treemap import build_treemap, patch_treemap
+from trend import build_trend
+from forecast import forecast_budgets
+from recurring import detect_recurring, build_recurring_table
+from export import EXPORT_FORMATS, export_chunks
+from transactions_grid import (
+    GRID_COLUMNS,
+    create_transactions_grid,
+    filter_and_sort_rows,
+    grid_page,
+)
 from config import (
     INDIVIDUAL_BUDGETS,
     CATEGORY_BUDGETS,
     CATEGORY_COLOR,
     NON_EXTRA_CATEGORIES,
     TRANSACTIONS_TABLE_PAGE_SIZE,
+    TRANSACTIONS_TABLE_MODE,
+    TRANSACTIONS_GRID_PAGE_SIZE,
+    FILTERED_VIEW_CACHE_SIZE,
+    ASSETS_MAX_AGE,
+    TREND_MONTHS,
 )
-import numpy as np
 import os
 
+# Options of the spender dropdown, see _filter_by_source
+SPENDERS = ["Both", "Jay", "Cara"]
+# Columns shown in the transactions table, edits re-render rows where they changed
+TABLE_COLUMNS = list(GRID_COLUMNS.values())
+
 
 class FinanceDashboard:
     def __init__(self, server):
@@ -34,32 +65,32 @@ class FinanceDashboard:
         self.individual_budgets = INDIVIDUAL_BUDGETS
         self.category_colors = CATEGORY_COLOR
 
-        # Not necessary but just as a reminder these values get set on data fetch
-        self.df = None
-        self.purchases_df = None
-        self.month_names = None
-        self.max_month = None
-        self.last_updated = None
-        # This one is necessary as it gets checked against the file mod time
-        self.last_modified = 0
-        # Set them
-        self.get_and_set_data_if_new()
+        # Loaded once here, then kept up to date off the request path
+        self.data = TransactionData()
+        self.data.refresh()
+        self.watcher = DataWatcher(self.data)
+        self.watcher.start()
 
-        # This will hold the filtered dataframe. Also not necessary to define right now
-        self.dff = None
+        # Filtered views keyed by selection and data version
+        self.filtered_views = LRUCache(FILTERED_VIEW_CACHE_SIZE)
+        # Recurring charges per spender, over all history so too costly to share
+        # the filtered views' LRU with the timespan and search views
+        self.recurring_views = LRUCache(len(SPENDERS))
 
         # Initialize Dash app with enhanced styling
         self.app = Dash(
             __name__,
             server=server,
+            # From their CDNs, only the dashboard's own CSS and JS are in assets/
             external_stylesheets=[
                 dbc.themes.BOOTSTRAP,
                 "https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap",
             ],
             url_base_pathname="/",
         )
+        self.server.after_request(self._cache_assets)
 
-        # Add custom CSS
+        # Page template, its styles are in assets/dashboard.css
         template_path = os.path.join(
             os.path.dirname(__file__), "templates", "index.html"
         )
@@ -70,37 +101,33 @@ class FinanceDashboard:
         self.app.layout = self._create_layout
         self._register_callbacks()
 
-    def get_and_set_data_if_new(self):
-        current_modified = fetch_csv_last_modified()
-        if current_modified > self.last_modified:
-            print("Refreshing data!")
-            self.df = fetch_transaction_df_all()
-            self.purchases_df = self.df[self.df.amount > 0]
-
-            # Get month data
-            month_periods = self.df["Month"].sort_values().unique()
-            self.month_names = [
-                self.df[self.df["Month"] == m]["Month_Name"].iloc[0]
-                for m in month_periods
-            ]
-            self.max_month = self.month_names[-1]
-            self.last_modified = current_modified
-            last_updated_dt = pd.to_datetime(current_modified, unit="s")
-            self.last_updated = last_updated_dt.strftime("%b %-d, %Y")
-        else:
-            print("Data is up-to-date.")
+        # Serialized layout per data version, and the (fixed) callback list
+        self.layouts = LRUCache(2)
+        self.dependencies = None
+        prefix = self.app.config.routes_pathname_prefix
+        self.server.view_functions[prefix + "_dash-layout"] = self._serve_layout
+        self.server.view_functions[prefix + "_dash-dependencies"] = (
+            self._serve_dependencies
+        )
+        # Authenticated like every other route, see auth.SimpleAuth
+        self.server.add_url_rule(
+            "/export/transactions", "export_transactions", self._export_transactions
+        )
 
     def _create_layout(self):
         """Create the enhanced dashboard layout"""
-        # Refresh data every load
-        self.get_and_set_data_if_new()
-
         # Get all unique categories for the dropdown
         all_categories = list(self.category_colors.keys())
+        # Range the custom timespan can be picked from
+        dates = self.data.purchases_df["date"]
+        first_date, last_date = (
+            (dates.iat[0].date(), dates.iat[-1].date()) if len(dates) else (None, None)
+        )
 
         return html.Div(
             [
-                html.Div(id="dummy-output"),  # Hidden div for the edit callback
+                # Version of the data the dashboard shows, for patching in edits
+                dcc.Store(id="dashboard-version"),
                 # Edit Transaction Modal
                 dbc.Modal(
                     [
@@ -177,7 +204,7 @@ class FinanceDashboard:
                         html.Div(
                             [
                                 html.Span(
-                                    f"Last updated: {self.last_updated}",
+                                    f"Last updated: {self.data.last_updated}",
                                     className="last-updated",
                                     style={
                                         "position": "absolute",
@@ -255,22 +282,29 @@ class FinanceDashboard:
                                                                     },
                                                                 ),
                                                                 dcc.Dropdown(
-                                                                    options=[
-                                                                        {
-                                                                            "label": name,
-                                                                            "value": name,
-                                                                        }
-                                                                        for name in self.month_names
-                                                                    ]
-                                                                    + [
-                                                                        {
-                                                                            "label": "Last 30 Days",
-                                                                            "value": "Last 30 Days",
-                                                                        }
-                                                                    ],
-                                                                    value=self.max_month,
+                                                                    options=timespan_options(
+                                                                        self.data.month_by_name
+                                                                    ),
+                                                                    value=self.data.max_month,
                                                                     id="timespan-selection",
                                                                 ),
+                                                                # Shown for CUSTOM_RANGE
+                                                                dcc.DatePickerRange(
+                                                                    id="custom-range",
+                                                                    min_date_allowed=first_date,
+                                                                    max_date_allowed=last_date,
+                                                                    initial_visible_month=last_date,
+                                                                    display_format="MMM D, YYYY",
+                                                                    style={
+                                                                        "display": "none",
+                                                                        "marginTop": "1rem",
+                                                                    },
+                                                                ),
+                                                                # The selected timespan, see ui.timespan
+                                                                dcc.Store(
+                                                                    id="timespan",
+                                                                    data=self.data.max_month,
+                                                                ),
                                                             ],
                                                             className="dropdown-container",
                                                         ),
@@ -291,11 +325,7 @@ class FinanceDashboard:
                                                                             "label": name,
                                                                             "value": name,
                                                                         }
-                                                                        for name in [
-                                                                            "Both",
-                                                                            "Jay",
-                                                                            "Cara",
-                                                                        ]
+                                                                        for name in SPENDERS
                                                                     ],
                                                                     value="Both",
                                                                     id="source-selection",
@@ -303,6 +333,26 @@ class FinanceDashboard:
                                                             ],
                                                             className="dropdown-container",
                                                         ),
+                                                        html.Div(
+                                                            [
+                                                                html.Label(
+                                                                    "Search Merchants",
+                                                                    style={
+                                                                        "fontWeight": "600",
+                                                                        "marginBottom": "1rem",
+                                                                        "textAlign": "center",
+                                                                        "color": "#4a5568",
+                                                                    },
+                                                                ),
+                                                                dbc.Input(
+                                                                    type="search",
+                                                                    placeholder="Merchant or description",
+                                                                    debounce=True,
+                                                                    id="search-query",
+                                                                ),
+                                                            ],
+                                                            className="dropdown-container",
+                                                        ),
                                                     ],
                                                     id="dropdowns-content",
                                                     className="minimized",
@@ -331,6 +381,41 @@ class FinanceDashboard:
                                     ],
                                     className="section-card",
                                 ),
+                                # Trend section
+                                html.Div(
+                                    [
+                                        html.H2(
+                                            "Monthly Trend",
+                                            className="section-title",
+                                        ),
+                                        dcc.Dropdown(
+                                            options=[
+                                                {
+                                                    "label": f"Last {count} months",
+                                                    "value": count,
+                                                }
+                                                for count in TREND_MONTHS
+                                            ],
+                                            value=TREND_MONTHS[0],
+                                            clearable=False,
+                                            id="trend-months",
+                                            style={"maxWidth": "250px"},
+                                        ),
+                                        dcc.Graph(id="trend-chart"),
+                                    ],
+                                    className="section-card",
+                                ),
+                                # Recurring charges section
+                                html.Div(
+                                    [
+                                        html.H2(
+                                            "Recurring Charges",
+                                            className="section-title",
+                                        ),
+                                        html.Div(id="recurring-charges"),
+                                    ],
+                                    className="section-card",
+                                ),
                                 # Recent Transactions section
                                 html.Div(
                                     [
@@ -367,26 +452,30 @@ class FinanceDashboard:
                                             n_clicks=1,
                                         ),
                                         html.Div(
-                                            [
-                                                html.Div(
-                                                    id="transactions-table",
-                                                ),
-                                                html.Div(
-                                                    [
-                                                        dbc.Pagination(
-                                                            max_value=10,  # how to set dynamically?
-                                                            fully_expanded=False,
-                                                            style={
-                                                                "textAlign": "center",
-                                                                "marginTop": "1rem",
-                                                                "fontSize": "14px",
-                                                            },
-                                                            id="transactions-pagination",
-                                                        )
-                                                    ],
-                                                    style={"marginTop": "1rem"},
-                                                ),
-                                            ],
+                                            (
+                                                [create_transactions_grid()]
+                                                if TRANSACTIONS_TABLE_MODE == "grid"
+                                                else [
+                                                    html.Div(
+                                                        id="transactions-table",
+                                                    ),
+                                                    html.Div(
+                                                        [
+                                                            dbc.Pagination(
+                                                                max_value=10,  # how to set dynamically?
+                                                                fully_expanded=False,
+                                                                style={
+                                                                    "textAlign": "center",
+                                                                    "marginTop": "1rem",
+                                                                    "fontSize": "14px",
+                                                                },
+                                                                id="transactions-pagination",
+                                                            )
+                                                        ],
+                                                        style={"marginTop": "1rem"},
+                                                    ),
+                                                ]
+                                            ),
                                             id="transactions-minimize-section",
                                             className="minimized",
                                         ),
@@ -402,97 +491,347 @@ class FinanceDashboard:
             ]
         )
 
-    def _filter_data_by_selectors(self, timespan_value, source_selection):
-        """Filter purchase data based on selected timespan"""
-        if timespan_value == "Last 30 Days":
-            time_filter = self.purchases_df["date"] >= (
-                pd.Timestamp.now() - pd.DateOffset(days=30)
+    def _cache_assets(self, response):
+        """Lets browsers keep files from assets/, Dash links them with a ?m=
+        (modification time) parameter that changes with the file"""
+        if (
+            flask.request.path.startswith(self.app.get_asset_url(""))
+            and "m" in flask.request.args
+            and response.status_code == 200
+        ):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSETS_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    def _serve_layout(self):
+        """Dash's /_dash-layout (as Dash.serve_layout makes it, with its layout
+        hooks), built and serialized once per data version"""
+        with self.data.lock:
+            key = (self.data.load_version, self.data.last_updated)
+            body, etag = self.layouts.get_or_compute(
+                key, lambda: _with_etag(self.app.serve_layout())
             )
+        return _json_response(body, etag)
+
+    def _serve_dependencies(self):
+        """Dash's /_dash-dependencies, which can't change once the app is serving"""
+        if self.dependencies is None:
+            self.dependencies = _with_etag(self.app.dependencies())
+        return _json_response(*self.dependencies)
+
+    def _export_transactions(self):
+        """Stream the purchases of a timespan, source and search (as in the filters)
+        in a format of export.EXPORT_FORMATS, e.g.
+        /export/transactions?timespan=August 2025&source=Jay&q=amazon&format=ndjson"""
+        args = flask.request.args
+        timespan_value = args.get("timespan", self.data.max_month)
+        source_selection = args.get("source", "Both")
+        search_query = args.get("q")
+        export_format = args.get("format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return flask.Response(
+                f"Unsupported format, use one of {', '.join(EXPORT_FORMATS)}",
+                status=400,
+            )
+        if source_selection not in SPENDERS or (
+            timespan_range(timespan_value, self.data.month_by_name) is None
+        ):
+            return flask.Response("Unknown timespan or source", status=400)
+
+        rows = self._filtered_view(timespan_value, source_selection, search_query)
+        filename = f"transactions {timespan_value} {source_selection}"
+        filename = filename.replace("/", " to ").replace(" ", "_")
+        return flask.Response(
+            export_chunks(rows, export_format, self.data.lock),
+            mimetype=EXPORT_FORMATS[export_format][1],
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="{filename}.{export_format}"'
+                )
+            },
+        )
+
+    def _filter_data_by_selectors(self, timespan_value, source_selection, search_query):
+        """Filter purchase data based on selected timespan (see timespans) and search"""
+        if timespan_value in self.data.month_by_name:
+            rows = self.data.month_purchases(self.data.month_by_name[timespan_value])
         else:
-            time_filter = self.purchases_df.Month_Name == timespan_value
-        dff = self.purchases_df[time_filter]
-        # If not both (looking at individual) filter out non-extra/essential categories
-        if source_selection != "Both":
-            source_filter = dff["account_id"].str.contains(source_selection) & ~dff[
-                "personal_finance_category.primary"
-            ].isin(NON_EXTRA_CATEGORIES)
-        else:
-            source_filter = np.array([True] * len(dff))
-        dff = dff[source_filter]
-        # Default to sorted so we don't have to recompute
-        self.dff = dff.sort_values(by="date", ascending=False)
+            span = timespan_range(timespan_value, self.data.month_by_name)
+            rows = (
+                self.data.purchases_between(*span)
+                if span is not None
+                else self.data.purchases_df.iloc[:0]
+            )
+        if search_query:
+            rows = self.data.search(rows, search_query)
+        # Newest first, purchases are kept sorted by date so no need to sort
+        return _filter_by_source(rows, source_selection).iloc[::-1]
+
+    def _view_version(self, timespan_value):
+        if timespan_value in self.data.month_by_name:
+            return self.data.data_version(self.data.month_by_name[timespan_value])
+        if is_relative(timespan_value):
+            # Also depends on today's date
+            return (self.data.data_version(), pd.Timestamp.now().date())
+        return self.data.data_version()
+
+    def _filtered_view(self, timespan_value, source_selection, search_query):
+        """Filtered purchases for a selection, shared by all sessions so read-only"""
+        search_query = normalize_query(search_query)
+        with self.data.lock:
+            return self.filtered_views.get_or_compute(
+                (
+                    "rows",
+                    timespan_value,
+                    source_selection,
+                    search_query,
+                    self._view_version(timespan_value),
+                ),
+                lambda: self._filter_data_by_selectors(
+                    timespan_value, source_selection, search_query
+                ),
+            )
+
+    def _aggregated_view(self, timespan_value, source_selection, search_query):
+        """Filtered purchases aggregated over aggregates.CUBE_DIMENSIONS, from the
+        per-month aggregates wherever the timespan covers whole months"""
+        search_query = normalize_query(search_query)
+        with self.data.lock:
+            span = timespan_range(timespan_value, self.data.month_by_name)
+            if search_query:
+                # The cube isn't by description, aggregate the (searched) rows
+                compute = lambda: aggregate(
+                    self._filtered_view(timespan_value, source_selection, search_query)
+                )
+            else:
+                compute = lambda: _filter_by_source(
+                    (
+                        self.data.aggregate_between(*span)
+                        if span is not None
+                        else EMPTY_AGGREGATE
+                    ),
+                    source_selection,
+                )
+            return self.filtered_views.get_or_compute(
+                (
+                    "aggregate",
+                    timespan_value,
+                    source_selection,
+                    search_query,
+                    self._view_version(timespan_value),
+                ),
+                compute,
+            )
+
+    def _dashboard_views(self, timespan_value, source_selection, search_query):
+        """(filtered purchases, their aggregate, treemap figure, data version) of a
+        selection, all from the same data even if a reload is swapped in meanwhile"""
+        search_query = normalize_query(search_query)
+        with self.data.lock:
+            dff = self._filtered_view(timespan_value, source_selection, search_query)
+            agg = self._aggregated_view(timespan_value, source_selection, search_query)
+            version = self._view_version(timespan_value)
+            treemap = self.filtered_views.get_or_compute(
+                ("treemap", timespan_value, source_selection, search_query, version),
+                lambda: build_treemap(agg, dff),
+            )
+        return dff, agg, treemap, repr(version)
+
+    def _grid_rows(
+        self, timespan_value, source_selection, search_query, filter_query, sort_by
+    ):
+        """Filtered purchases as filtered and sorted in the transactions grid"""
+        sort_key = tuple((s["column_id"], s["direction"]) for s in sort_by or [])
+        search_query = normalize_query(search_query)
+        with self.data.lock:
+            return self.filtered_views.get_or_compute(
+                (
+                    "grid",
+                    timespan_value,
+                    source_selection,
+                    search_query,
+                    filter_query,
+                    sort_key,
+                    self._view_version(timespan_value),
+                ),
+                lambda: filter_and_sort_rows(
+                    self._filtered_view(timespan_value, source_selection, search_query),
+                    filter_query,
+                    sort_by,
+                ),
+            )
+
+    def _trend_view(self, month_count, source_selection, budgets):
+        """Trend chart of the month_count months up to the latest one"""
+        with self.data.lock:
+            if self.data.max_month is None:
+                return {}
+            last = self.data.month_by_name[self.data.max_month]
+            months = list(pd.period_range(end=last, periods=month_count, freq="M"))
+            return self.filtered_views.get_or_compute(
+                ("trend", month_count, source_selection, self.data.data_version()),
+                lambda: build_trend(
+                    _filter_by_source(
+                        self.data.cube.monthly_totals(months), source_selection
+                    ),
+                    months,
+                    budgets,
+                ),
+            )
+
+    def _recurring_view(self, source_selection):
+        """Table of the recurring charges over all purchases of a spender"""
+        with self.data.lock:
+            return self.recurring_views.get_or_compute(
+                (source_selection, self.data.data_version()),
+                lambda: build_recurring_table(
+                    detect_recurring(
+                        _filter_by_source(self.data.purchases_df, source_selection)
+                    )
+                ),
+            )
+
+    def _forecast_view(self, timespan_value, source_selection, search_query, budgets):
+        """End of month forecasts (see forecast.forecast_budgets) when the current
+        month is selected without a search, otherwise None"""
+        today = pd.Timestamp.now()
+        if normalize_query(search_query) or self.data.month_by_name.get(
+            timespan_value
+        ) != pd.Period(today, freq="M"):
+            return None
+        with self.data.lock:
+            return self.filtered_views.get_or_compute(
+                (
+                    "forecast",
+                    source_selection,
+                    self.data.data_version(),
+                    today.date(),
+                ),
+                lambda: forecast_budgets(
+                    _filter_by_source(self.data.purchases_df, source_selection),
+                    budgets,
+                    today,
+                ),
+            )
 
     def _register_callbacks(self):
         """Register all dashboard callbacks"""
 
+        # The HTML table is filled in along with the rest, the grid has its own callback
+        table_outputs = (
+            []
+            if TRANSACTIONS_TABLE_MODE == "grid"
+            else [
+                Output("transactions-table", "children"),
+                Output("transactions-pagination", "active_page"),
+                Output("transactions-pagination", "max_value"),
+            ]
+        )
+
         @callback(
             [
                 Output("treemap-content", "figure"),
                 Output("budget-progress-section", "children"),
-                Output("transactions-table", "children"),
-                Output("transactions-pagination", "active_page"),
-                Output("transactions-pagination", "max_value"),
+                Output("dashboard-version", "data"),
+                *table_outputs,
             ],
             [
-                Input("timespan-selection", "value"),
+                Input("timespan", "data"),
                 Input("source-selection", "value"),
-                Input("dummy-output", "children"),
+                Input("search-query", "value"),
             ],
         )
         def update_whole_dashboard_on_filter_change(
-            timespan_value, source_selection, dummy_val
+            timespan_value, source_selection, search_query
         ):
-            self._filter_data_by_selectors(timespan_value, source_selection)
-            if len(self.dff) == 0:
-                return {}, html.Div("No data available for the selected filters.")
-            treemap = update_treemap()
-            budget_section = update_budget_progress(source_selection)
-            transactions_table = update_transactions_table(1)
-            max_pages = len(self.dff) // TRANSACTIONS_TABLE_PAGE_SIZE + 1
-            return treemap, budget_section, transactions_table, 1, max_pages
-
-        def update_treemap():
-            chart = px.treemap(
-                self.dff,
-                path=["personal_finance_category.primary", "merchant_name"],
-                values="amount",
-                color="personal_finance_category.primary",
-                color_discrete_map=self.category_colors,
-                hover_data=["name", "amount", "date", "account_id"],
+            views = self._dashboard_views(
+                timespan_value, source_selection, search_query
             )
-
-            # Enhanced chart styling
-            chart.update_traces(
-                marker=dict(cornerradius=8, line=dict(width=2, color="white")),
-                textfont_size=16,
-                textfont_color="black",
-                textfont_family="Inter",
+            outputs = render_dashboard(
+                views, timespan_value, source_selection, search_query
             )
+            if not table_outputs:
+                return outputs
+            dff = views[0]
+            if len(dff) == 0:
+                return (*outputs, None, 1, 1)
+            transactions_table = build_transactions_table(dff, 1)
+            max_pages = len(dff) // TRANSACTIONS_TABLE_PAGE_SIZE + 1
+            return (*outputs, transactions_table, 1, max_pages)
 
-            chart.update_layout(
-                margin=dict(l=0, r=0, t=0, b=0),
-                paper_bgcolor="rgba(0,0,0,0)",
-                plot_bgcolor="rgba(0,0,0,0)",
-                font=dict(family="Inter, sans-serif", size=14, color="#4a5568"),
+        def render_dashboard(views, timespan_value, source_selection, search_query):
+            """Treemap, budget section and version outputs for _dashboard_views"""
+            dff, agg, treemap, version = views
+            if len(dff) == 0:
+                return (
+                    {},
+                    html.Div("No data available for the selected filters."),
+                    version,
+                )
+            budgets = budgets_for(source_selection)
+            forecasts = self._forecast_view(
+                timespan_value, source_selection, search_query, budgets
             )
+            return treemap, create_budget_section(agg, budgets, forecasts), version
 
-            return chart
-
-        def update_budget_progress(source_selection):
+        def budgets_for(source_selection):
             if source_selection == "Both":
-                return create_budget_section(self.dff, self.category_budgets)
+                return self.category_budgets
             else:
-                return create_budget_section(self.dff, self.individual_budgets)
+                return self.individual_budgets
 
         @callback(
-            Output("transactions-table", "children", allow_duplicate=True),
-            Input("transactions-pagination", "active_page"),
-            prevent_initial_call=True,
+            Output("trend-chart", "figure"),
+            [
+                Input("trend-months", "value"),
+                Input("source-selection", "value"),
+                # Written whenever the data shown changes, e.g. after an edit
+                Input("dashboard-version", "data"),
+            ],
         )
-        def update_transactions_table(page):
+        def update_trend(month_count, source_selection, _):
+            return self._trend_view(
+                month_count, source_selection, budgets_for(source_selection)
+            )
+
+        @callback(
+            Output("recurring-charges", "children"),
+            [
+                Input("source-selection", "value"),
+                Input("dashboard-version", "data"),
+            ],
+        )
+        def update_recurring(source_selection, _):
+            return self._recurring_view(source_selection)
+
+        if TRANSACTIONS_TABLE_MODE == "grid":
+            self._register_grid_callbacks()
+        else:
+
+            @callback(
+                Output("transactions-table", "children", allow_duplicate=True),
+                Input("transactions-pagination", "active_page"),
+                [
+                    State("timespan", "data"),
+                    State("source-selection", "value"),
+                    State("search-query", "value"),
+                ],
+                prevent_initial_call=True,
+            )
+            def update_transactions_table(
+                page, timespan_value, source_selection, search_query
+            ):
+                dff = self._filtered_view(
+                    timespan_value, source_selection, search_query
+                )
+                return build_transactions_table(dff, page)
+
+        def build_transactions_table(dff, page):
             start_idx = (page - 1) * TRANSACTIONS_TABLE_PAGE_SIZE
             end_idx = start_idx + TRANSACTIONS_TABLE_PAGE_SIZE
-            rows = self.dff.iloc[start_idx:end_idx]
+            rows = dff.iloc[start_idx:end_idx]
             transactions_table = html.Div(
                 html.Table(
                     [
@@ -524,68 +863,7 @@ class FinanceDashboard:
                         # Body
                         html.Tbody(
                             [
-                                html.Tr(
-                                    [
-                                        html.Td(
-                                            row["date"].strftime("%Y-%m-%d"),
-                                            style={
-                                                "padding": "12px",
-                                                "borderBottom": "1px solid #e2e8f0",
-                                            },
-                                        ),
-                                        html.Td(
-                                            row["merchant_name"],
-                                            style={
-                                                "padding": "12px",
-                                                "borderBottom": "1px solid #e2e8f0",
-                                            },
-                                        ),
-                                        html.Td(
-                                            f"${row['amount']:.2f}",
-                                            style={
-                                                "padding": "12px",
-                                                "borderBottom": "1px solid #e2e8f0",
-                                                "textAlign": "right",
-                                            },
-                                        ),
-                                        html.Td(
-                                            row["personal_finance_category.primary"],
-                                            style={
-                                                "padding": "12px",
-                                                "borderBottom": "1px solid #e2e8f0",
-                                            },
-                                        ),
-                                        html.Td(
-                                            row["account_id"],
-                                            style={
-                                                "padding": "12px",
-                                                "borderBottom": "1px solid #e2e8f0",
-                                            },
-                                        ),
-                                        html.Td(
-                                            html.Button(
-                                                "Edit",
-                                                id={
-                                                    "type": "edit-transaction",
-                                                    "index": row["transaction_id"],
-                                                },
-                                                style={
-                                                    "backgroundColor": "#4299e1",
-                                                    "color": "white",
-                                                    "border": "none",
-                                                    "padding": "8px 16px",
-                                                    "borderRadius": "4px",
-                                                    "cursor": "pointer",
-                                                },
-                                            ),
-                                            style={
-                                                "padding": "12px",
-                                                "borderBottom": "1px solid #e2e8f0",
-                                            },
-                                        ),
-                                    ],
-                                    style={"backgroundColor": "white"},
-                                )
+                                build_transactions_row(row)
                                 for _, row in rows.iterrows()  # Show only the 10 most recent transactions
                             ]
                         ),
@@ -606,7 +884,73 @@ class FinanceDashboard:
             )
             return transactions_table
 
-        @callback(
+        def build_transactions_row(row):
+            return html.Tr(
+                [
+                    html.Td(
+                        row["date"].strftime("%Y-%m-%d"),
+                        style={
+                            "padding": "12px",
+                            "borderBottom": "1px solid #e2e8f0",
+                        },
+                    ),
+                    html.Td(
+                        row["merchant_name"],
+                        style={
+                            "padding": "12px",
+                            "borderBottom": "1px solid #e2e8f0",
+                        },
+                    ),
+                    html.Td(
+                        f"${row['amount'] / 100:.2f}",
+                        style={
+                            "padding": "12px",
+                            "borderBottom": "1px solid #e2e8f0",
+                            "textAlign": "right",
+                        },
+                    ),
+                    html.Td(
+                        row["personal_finance_category.primary"],
+                        style={
+                            "padding": "12px",
+                            "borderBottom": "1px solid #e2e8f0",
+                        },
+                    ),
+                    html.Td(
+                        row["account_id"],
+                        style={
+                            "padding": "12px",
+                            "borderBottom": "1px solid #e2e8f0",
+                        },
+                    ),
+                    html.Td(
+                        html.Button(
+                            "Edit",
+                            id={
+                                "type": "edit-transaction",
+                                "index": row["transaction_id"],
+                            },
+                            style={
+                                "backgroundColor": "#4299e1",
+                                "color": "white",
+                                "border": "none",
+                                "padding": "8px 16px",
+                                "borderRadius": "4px",
+                                "cursor": "pointer",
+                            },
+                        ),
+                        style={
+                            "padding": "12px",
+                            "borderBottom": "1px solid #e2e8f0",
+                        },
+                    ),
+                ],
+                style={"backgroundColor": "white"},
+            )
+
+        # UI-only callbacks run in the browser, see assets/ui.js
+        clientside_callback(
+            ClientsideFunction("ui", "toggleMinimized"),
             [
                 Output("dropdowns-content", "className"),
                 Output("minimize-button", "children"),
@@ -614,12 +958,9 @@ class FinanceDashboard:
             Input("filters-header", "n_clicks"),
             prevent_initial_call=True,
         )
-        def toggle_dropdown_visibility(n_clicks):
-            if n_clicks % 2 == 1:
-                return "minimized", "+"
-            return "", "−"  # Unicode minus sign
 
-        @callback(
+        clientside_callback(
+            ClientsideFunction("ui", "toggleMinimized"),
             [
                 Output("transactions-minimize-section", "className"),
                 Output("transactions-minimize-button", "children"),
@@ -627,64 +968,83 @@ class FinanceDashboard:
             Input("transactions-header", "n_clicks"),
             prevent_initial_call=True,
         )
-        def toggle_transactions_visibility(n_clicks):
-            return toggle_dropdown_visibility(n_clicks)
 
-        @callback(
+        clientside_callback(
+            ClientsideFunction("ui", "closeModal"),
+            Output("edit-modal", "is_open", allow_duplicate=True),
             [
-                Output("edit-modal", "is_open"),
-                Output("edit-transaction-id", "value"),
-                Output("edit-amount-input", "value"),
-                Output("edit-category-dropdown", "value"),
-            ],
-            [
-                Input({"type": "edit-transaction", "index": ALL}, "n_clicks"),
                 Input("edit-modal-close", "n_clicks"),
                 Input("edit-modal-save", "n_clicks"),
                 Input("edit-modal-reset", "n_clicks"),
             ],
+            prevent_initial_call=True,
+        )
+
+        clientside_callback(
+            ClientsideFunction("ui", "timespan"),
+            [Output("timespan", "data"), Output("custom-range", "style")],
             [
-                State({"type": "edit-transaction", "index": ALL}, "id"),
-                State("edit-modal", "is_open"),
+                Input("timespan-selection", "value"),
+                Input("custom-range", "start_date"),
+                Input("custom-range", "end_date"),
             ],
+            [State("timespan", "data"), State("custom-range", "style")],
+            prevent_initial_call=True,
         )
-        def toggle_edit_modal(
-            edit_clicks, close_clicks, save_clicks, reset_clicks, button_ids, is_open
-        ):
+
+        @callback(
+            [
+                Output("edit-modal", "is_open"),
+                Output("edit-transaction-id", "value"),
+                Output("edit-amount-input", "value"),
+                Output("edit-category-dropdown", "value"),
+            ],
+            Input({"type": "edit-transaction", "index": ALL}, "n_clicks"),
+            prevent_initial_call=True,
+        )
+        def open_edit_modal(edit_clicks):
             ctx = callback_context
             if not ctx.triggered:
                 raise PreventUpdate
 
-            trigger_id = ctx.triggered[0]["prop_id"]
-
-            # Handle modal close/save/reset buttons
-            if (
-                "edit-modal-close" in trigger_id
-                or "edit-modal-save" in trigger_id
-                or "edit-modal-reset" in trigger_id
-            ):
-                return False, "", None, None
-
             # Handle initial load case - all edit_clicks will be None
             if all(click is None for click in edit_clicks):
                 raise PreventUpdate
 
-            # Handle edit button clicks
-            if ".n_clicks" in trigger_id:
-                button_index = eval(trigger_id.split(".")[0])["index"]
-                transaction_id = button_index
-
-                # Get current transaction data
-                row = self.dff[self.dff["transaction_id"] == transaction_id].iloc[0]
-                current_amount = row["amount"]
-                current_category = row["personal_finance_category.primary"]
-
-                return True, transaction_id, current_amount, current_category
+            # Handle edit button clicks, whose ids hold the transaction_id as index
+            trigger_id = ctx.triggered_id
+            if isinstance(trigger_id, dict):
+                return self._edit_modal_values(trigger_id["index"])
 
             raise PreventUpdate
 
+        # Edits are patched into what the dashboard shows instead of rebuilding it
+        if TRANSACTIONS_TABLE_MODE == "grid":
+            table_page_size = TRANSACTIONS_GRID_PAGE_SIZE
+            table_patch_outputs = [
+                Output("transactions-grid", "data", allow_duplicate=True),
+                Output("transactions-grid", "page_count", allow_duplicate=True),
+            ]
+            table_states = [
+                State("transactions-grid", "page_current"),
+                State("transactions-grid", "sort_by"),
+                State("transactions-grid", "filter_query"),
+            ]
+        else:
+            table_page_size = TRANSACTIONS_TABLE_PAGE_SIZE
+            table_patch_outputs = [
+                Output("transactions-table", "children", allow_duplicate=True),
+                Output("transactions-pagination", "max_value", allow_duplicate=True),
+            ]
+            table_states = [State("transactions-pagination", "active_page")]
+
         @callback(
-            Output("dummy-output", "children"),
+            [
+                Output("treemap-content", "figure", allow_duplicate=True),
+                Output("budget-progress-section", "children", allow_duplicate=True),
+                Output("dashboard-version", "data", allow_duplicate=True),
+                *table_patch_outputs,
+            ],
             [
                 Input("edit-modal-save", "n_clicks"),
                 Input("edit-modal-reset", "n_clicks"),
@@ -693,10 +1053,25 @@ class FinanceDashboard:
                 State("edit-transaction-id", "value"),
                 State("edit-amount-input", "value"),
                 State("edit-category-dropdown", "value"),
+                State("timespan", "data"),
+                State("source-selection", "value"),
+                State("search-query", "value"),
+                State("dashboard-version", "data"),
+                *table_states,
             ],
+            prevent_initial_call=True,
         )
         def handle_edit_save_or_reset(
-            save_n_clicks, reset_n_clicks, transaction_id, new_amount, new_category
+            save_n_clicks,
+            reset_n_clicks,
+            transaction_id,
+            new_amount,
+            new_category,
+            timespan_value,
+            source_selection,
+            search_query,
+            shown_version,
+            *table_state,
         ):
             if not save_n_clicks and not reset_n_clicks:
                 raise PreventUpdate
@@ -708,25 +1083,221 @@ class FinanceDashboard:
             if not ctx.triggered:
                 raise PreventUpdate
 
-            trigger_id = ctx.triggered[0]["prop_id"]
+            trigger_id = ctx.triggered_id
             print(trigger_id)
-            if "edit-modal-reset" in trigger_id:
-                delete_override(transaction_id)
-                self.get_and_set_data_if_new()  # Refresh data after edit
-                return ""
-
-            if "edit-modal-save" in trigger_id and (
+            budgets = budgets_for(source_selection)
+            before = self._dashboard_views(
+                timespan_value, source_selection, search_query
+            )
+            before_forecasts = self._forecast_view(
+                timespan_value, source_selection, search_query, budgets
+            )
+            before_rows, page = table_rows(
+                before[0], timespan_value, source_selection, search_query, table_state
+            )
+            # A copy, the edit patches the rows of the cached views in place
+            before_page = table_page(before_rows, page).copy()
+            if trigger_id == "edit-modal-reset":
+                store_fingerprints = delete_override(transaction_id)
+                # Patch the edit in rather than reloading everything
+                self.data.clear_override(transaction_id)
+                self.data.record_override_write(*store_fingerprints)
+            elif trigger_id == "edit-modal-save" and (
                 new_amount is not None or new_category is not None
             ):
-                upsert_override(
+                new_amount = float(new_amount) if new_amount is not None else None
+                store_fingerprints = upsert_override(
                     transaction_id=transaction_id,
-                    new_amount=float(new_amount) if new_amount else None,
+                    new_amount=new_amount,
                     new_category=new_category,
                 )
-                self.get_and_set_data_if_new()  # Refresh data after edit
-                return ""
+                self.data.patch_override(
+                    transaction_id,
+                    amount=round(new_amount * 100) if new_amount is not None else None,
+                    category=new_category,
+                )
+                self.data.record_override_write(*store_fingerprints)
+            else:
+                raise PreventUpdate
 
-            raise PreventUpdate
+            after = self._dashboard_views(
+                timespan_value, source_selection, search_query
+            )
+            rows, page = table_rows(
+                after[0], timespan_value, source_selection, search_query, table_state
+            )
+            if shown_version != before[3] or len(before[0]) == 0 or len(after[0]) == 0:
+                # Not showing what the patches would apply to, send everything
+                return (
+                    *render_dashboard(
+                        after, timespan_value, source_selection, search_query
+                    ),
+                    *render_table(rows, page),
+                )
+            return (
+                patch_treemap(before[2], after[2]),
+                patch_budget_section(
+                    before[1],
+                    after[1],
+                    budgets,
+                    before_forecasts,
+                    self._forecast_view(
+                        timespan_value, source_selection, search_query, budgets
+                    ),
+                ),
+                after[3],
+                *patch_table(before_page, len(before_rows), rows, page),
+            )
+
+        def table_rows(
+            dff, timespan_value, source_selection, search_query, table_state
+        ):
+            """The rows the table pages through, and its current page (from 0)"""
+            if TRANSACTIONS_TABLE_MODE == "grid":
+                page, sort_by, filter_query = table_state
+                rows = self._grid_rows(
+                    timespan_value,
+                    source_selection,
+                    search_query,
+                    filter_query,
+                    sort_by,
+                )
+                return rows, page or 0
+            return dff, (table_state[0] or 1) - 1
+
+        def render_table(rows, page):
+            """The table outputs of handle_edit_save_or_reset for a whole page"""
+            if TRANSACTIONS_TABLE_MODE == "grid":
+                page_count = max(-(-len(rows) // TRANSACTIONS_GRID_PAGE_SIZE), 1)
+                return grid_page(rows, min(page, page_count - 1)), page_count
+            if len(rows) == 0:
+                return None, 1
+            max_pages = len(rows) // TRANSACTIONS_TABLE_PAGE_SIZE + 1
+            return build_transactions_table(rows, page + 1), max_pages
+
+        def table_page(rows, page):
+            start = page * table_page_size
+            return rows.iloc[start : start + table_page_size]
+
+        def patch_table(before_page, before_count, rows, page):
+            """The table outputs of handle_edit_save_or_reset, only replacing the
+            rows that changed if the page still has the same transactions"""
+            page_rows = table_page(rows, page)
+            if before_count != len(rows) or not np.array_equal(
+                before_page["transaction_id"], page_rows["transaction_id"]
+            ):
+                return render_table(rows, page)
+
+            changed = np.flatnonzero(
+                (
+                    before_page[TABLE_COLUMNS].to_numpy()
+                    != page_rows[TABLE_COLUMNS].to_numpy()
+                ).any(axis=1)
+            )
+            if len(changed) == 0:
+                return no_update, no_update
+            table = Patch()
+            if TRANSACTIONS_TABLE_MODE == "grid":
+                records = grid_page(rows, page)
+                for i in changed:
+                    table[int(i)] = records[i]
+            else:
+                # Div > Table > Tbody > rows
+                body = table["props"]["children"]["props"]["children"][1]["props"][
+                    "children"
+                ]
+                for i in changed:
+                    body[int(i)] = build_transactions_row(page_rows.iloc[i])
+            return table, no_update
+
+    def _edit_modal_values(self, transaction_id):
+        """Outputs that open the edit modal on a transaction"""
+        # Get current transaction data
+        row = self.data.get_row(transaction_id)
+        current_amount = row["amount"] / 100
+        current_category = row["personal_finance_category.primary"]
+
+        return True, transaction_id, current_amount, current_category
+
+    def _register_grid_callbacks(self):
+        """Callbacks of the transactions grid (TRANSACTIONS_TABLE_MODE "grid")"""
+
+        @callback(
+            [
+                Output("transactions-grid", "data"),
+                Output("transactions-grid", "page_count"),
+                Output("transactions-grid", "page_current"),
+            ],
+            [
+                Input("transactions-grid", "page_current"),
+                Input("transactions-grid", "sort_by"),
+                Input("transactions-grid", "filter_query"),
+                Input("timespan", "data"),
+                Input("source-selection", "value"),
+                Input("search-query", "value"),
+            ],
+        )
+        def update_transactions_grid(
+            page, sort_by, filter_query, timespan_value, source_selection, search_query
+        ):
+            # Back to the first page when the rows change
+            if callback_context.triggered_prop_ids.keys() - {
+                "transactions-grid.page_current"
+            }:
+                page = 0
+            rows = self._grid_rows(
+                timespan_value, source_selection, search_query, filter_query, sort_by
+            )
+            page_count = max(-(-len(rows) // TRANSACTIONS_GRID_PAGE_SIZE), 1)
+            page = min(page or 0, page_count - 1)
+            return grid_page(rows, page), page_count, page
+
+        @callback(
+            [
+                Output("edit-modal", "is_open", allow_duplicate=True),
+                Output("edit-transaction-id", "value", allow_duplicate=True),
+                Output("edit-amount-input", "value", allow_duplicate=True),
+                Output("edit-category-dropdown", "value", allow_duplicate=True),
+                Output("transactions-grid", "active_cell"),
+            ],
+            Input("transactions-grid", "active_cell"),
+            prevent_initial_call=True,
+        )
+        def edit_from_grid(active_cell):
+            if not active_cell or active_cell["column_id"] != "edit":
+                raise PreventUpdate
+            # Cleared so clicking the same cell again reopens the modal
+            return *self._edit_modal_values(active_cell["row_id"]), None
+
+
+def _filter_by_source(purchases_df, source_selection):
+    """Purchases of one spender, or all of them for "Both"
+
+    Works on rows as well as on their aggregate.
+    """
+    # If not both (looking at individual) filter out non-extra/essential categories
+    if source_selection == "Both":
+        return purchases_df
+    source_filter = purchases_df["account_id"].str.contains(
+        source_selection
+    ) & ~purchases_df["personal_finance_category.primary"].isin(NON_EXTRA_CATEGORIES)
+    return purchases_df[source_filter]
+
+
+def _with_etag(response: flask.Response):
+    """(body, ETag) of one of Dash's JSON responses, the ETag only depends on the
+    body so all workers agree on it"""
+    body = response.get_data()
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def _json_response(body, etag) -> flask.Response:
+    """A JSON response, or a 304 if the browser already has this ETag"""
+    response = flask.Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Browsers revalidate on every load instead of using a stale copy
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(flask.request)
 
 
 def create_dashboard(server):
@@ -0,0 +1,80 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import time
+from config import MAIN_DATA_LOC, OVERRIDES_LOC, OVERRIDES_DB_LOC, DATA_WATCH_INTERVAL
+
+# inotify(7) events that mean a file in a watched directory may have changed
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Writers like the sync job touch a file many times, wait for them to settle
+SETTLE_SECONDS = 0.5
+
+
+def _inotify_fd(directories):
+    """An inotify descriptor watching directories, or None where inotify isn't
+    available"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+class DataWatcher:
+    """Refreshes a TransactionData from a background thread whenever the data
+    files change, so requests never stat or load them
+
+    Changes are noticed with inotify where available, otherwise by checking
+    every DATA_WATCH_INTERVAL seconds.
+    """
+
+    def __init__(self, data, interval=DATA_WATCH_INTERVAL):
+        self.data = data
+        self.interval = interval
+        self.directories = {
+            os.path.dirname(os.path.abspath(path))
+            for path in (MAIN_DATA_LOC, OVERRIDES_LOC, OVERRIDES_DB_LOC)
+        }
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def _wait(self, fd) -> None:
+        if fd is None:
+            time.sleep(self.interval)
+            return
+        readable, _, _ = select.select([fd], [], [], self.interval)
+        if readable:
+            time.sleep(SETTLE_SECONDS)
+            # Drain the events, the refresh works out what actually changed
+            while select.select([fd], [], [], 0)[0]:
+                os.read(fd, 65536)
+
+    def _run(self) -> None:
+        fd = _inotify_fd(self.directories)
+        print(
+            f"Worker {os.getpid()}: watching data files "
+            + ("with inotify" if fd is not None else f"every {self.interval}s")
+        )
+        while True:
+            self._wait(fd)
+            try:
+                self.data.refresh()
+            except Exception as e:
+                # e.g. a file caught mid-write, the next change retries
+                print(f"Data refresh failed: {e!r}")
@@ -1,34 +1,308 @@
 #!python3
+import numpy as np
 import pandas as pd
-from config import MAIN_DATA_LOC, OVERRIDES_LOC
+from config import MAIN_DATA_LOC, CACHE_DIR
+from overrides_helpers import get_override_store
+from collections import namedtuple
+from typing import Optional
+import io
 import os
+import pickle
 
+BASE_CACHE_LOC = os.path.join(CACHE_DIR, "transactions.pkl")
+MERGED_CACHE_LOC = os.path.join(CACHE_DIR, "transactions_merged.pkl")
+TAIL_CHECK_BYTES = 256
+# Bump when the in-memory schema changes so old caches are ignored
+SCHEMA_VERSION = 3
 
-def fetch_transaction_df_all() -> pd.DataFrame:
-    df = pd.read_csv(MAIN_DATA_LOC)
 
-    # Read overrides
-    overrides_df = pd.read_csv(OVERRIDES_LOC)
+def file_fingerprint(path) -> tuple:
+    """(path, size, mtime) of a file - changes whenever the file is rewritten"""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
 
-    # Create index on transaction_id for both dataframes
-    df.set_index("transaction_id", inplace=True)
-    overrides_df.set_index("transaction_id", inplace=True)
 
-    # Update matching rows with override values
-    df.update(overrides_df)
+def _load_cache_entry(cache_loc) -> Optional[dict]:
+    """Return the cache entry, or None if it is missing or uses an older schema"""
+    try:
+        with open(cache_loc, "rb") as f:
+            entry = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+    if not isinstance(entry, dict) or entry.get("schema") != SCHEMA_VERSION:
+        return None
+    return entry
 
-    # Reset index to make transaction_id a regular column again
-    df.reset_index(inplace=True)
 
+def _write_cache(cache_loc, key, df, **extra) -> None:
+    """Atomically replace the cache file so concurrent readers never see a partial write"""
+    tmp_loc = f"{cache_loc}.{os.getpid()}.tmp"
+    entry = {"schema": SCHEMA_VERSION, "key": key, "df": df, **extra}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_loc, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_loc, cache_loc)
+    except OSError as e:
+        # The cache is only an optimization, never fail a load because of it
+        print(f"Could not write cache {cache_loc}: {e}")
+
+
+def to_cents(amounts: pd.Series) -> pd.Series:
+    """Dollar amounts as integer cents (float if some are missing)"""
+    cents = (amounts.astype(float) * 100).round()
+    return cents if cents.isna().any() else cents.astype("int64")
+
+
+def _apply_schema(df: pd.DataFrame, keep_missing: bool = False) -> pd.DataFrame:
+    """Convert freshly parsed CSV columns to the in-memory schema
+
+    - amount: int64 cents
+    - date: datetime64
+    - transaction_id: str
+    - everything else: categorical str, these repeat heavily across rows
+
+    With keep_missing (used for overrides) missing values stay missing so they
+    don't overwrite anything, and strings stay plain.
+    """
+    for col in df.columns:
+        if col == "amount":
+            df[col] = to_cents(df[col])
+        elif col == "date":
+            df[col] = pd.to_datetime(df[col])
+        else:
+            values = df[col].astype(str)
+            if keep_missing:
+                values = values.where(df[col].notna())
+            elif col != "transaction_id":
+                values = values.astype("category")
+            df[col] = values
+    return df
+
+
+def set_column_values(df: pd.DataFrame, col, positions, values) -> None:
+    """Assign values to rows at positions in place, keeping the column's dtype"""
+    values = pd.Series(values)
+    if isinstance(df[col].dtype, pd.CategoricalDtype):
+        new_categories = pd.Index(values.unique()).difference(df[col].cat.categories)
+        if len(new_categories) > 0:
+            df[col] = df[col].cat.add_categories(new_categories)
+    else:
+        values = values.astype(df[col].dtype)
+    df.iloc[positions, df.columns.get_loc(col)] = values.to_numpy()
+
+
+def concat_transactions(df: pd.DataFrame, new_rows: pd.DataFrame) -> pd.DataFrame:
+    """pd.concat that keeps categorical columns categorical"""
+    new_rows = new_rows.copy()
     for col in df.columns:
-        if col != "amount":
-            df[col] = df[col].astype(str)
-    df["date"] = pd.to_datetime(df["date"])
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            categories = df[col].cat.categories
+            extra = new_rows[col].astype(str).unique()
+            extra = pd.Index(extra).difference(categories)
+            if len(extra) > 0:
+                df = df.assign(**{col: df[col].cat.add_categories(extra)})
+            new_rows[col] = pd.Categorical(
+                new_rows[col].astype(str), categories=df[col].cat.categories
+            )
+    return pd.concat([df, new_rows])
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def _read_main_csv():
+    """Parse all of transactions.csv, returning the typed frame and its ingest state
+
+    The ingest state remembers how much of the file has been consumed so that
+    rows appended later can be parsed on their own (see fetch_appended_transactions).
+    A last row without a trailing newline is kept, it may be the file's end,
+    and fetch_appended_transactions checks it was complete.
+    """
+    with open(MAIN_DATA_LOC, "rb") as f:
+        data = f.read()
+    df = _apply_schema(pd.read_csv(io.BytesIO(data)))
+    state = {
+        "header": data[: data.find(b"\n") + 1],
+        "offset": len(data),
+        "rows": len(df),
+        # Used to tell an append apart from a rewrite that happens to be longer
+        "tail_check": data[-TAIL_CHECK_BYTES:],
+        "columns": list(df.columns),
+        # Whether the last row was read without its newline
+        "unterminated": data[-1:] not in (b"", b"\n"),
+    }
+    return df, state
+
+
+def fetch_appended_transactions(state: dict):
+    """Parse only the rows appended to transactions.csv since state was taken
+
+    Returns (new_rows_df, new_state), or None if the file was rewritten rather
+    than appended to (it shrank, its header changed or the consumed bytes differ)
+    and a full reload is needed. Like _read_main_csv, a last row without a
+    trailing newline is kept.
+    """
+    offset = state["offset"]
+    with open(MAIN_DATA_LOC, "rb") as f:
+        if os.fstat(f.fileno()).st_size < offset:
+            return None
+        if f.read(len(state["header"])) != state["header"]:
+            return None
+        check = state["tail_check"]
+        f.seek(offset - len(check))
+        if f.read(len(check)) != check:
+            return None
+        tail = f.read()
+
+    # A last row read without its newline must now be followed by one, anything
+    # else means that row was still being written and has to be read again
+    newline = b""
+    if state.get("unterminated") and tail:
+        if tail[:1] != b"\n":
+            return None
+        newline, tail = b"\n", tail[1:]
+
+    if tail:
+        new_rows = _apply_schema(
+            pd.read_csv(io.BytesIO(tail), header=None, names=state["columns"])
+        )
+    else:
+        new_rows = _apply_schema(pd.DataFrame(columns=state["columns"]))
+    new_state = dict(
+        state,
+        offset=offset + len(newline) + len(tail),
+        rows=state["rows"] + len(new_rows),
+        tail_check=(check + newline + tail)[-TAIL_CHECK_BYTES:],
+        unterminated=(
+            tail[-1:] != b"\n"
+            if tail
+            else state.get("unterminated", False) and not newline
+        ),
+    )
+    return new_rows, new_state
+
+
+def _fetch_base_df():
+    """Typed transactions without overrides, served from cache when the CSV is unchanged
+
+    A cache built from an earlier version of an append-only transactions.csv is
+    extended with just the appended rows instead of being rebuilt.
+    """
+    key = file_fingerprint(MAIN_DATA_LOC)
+    entry = _load_cache_entry(BASE_CACHE_LOC)
+    if entry is not None and entry["key"] == key:
+        return entry["df"], entry["state"]
+
+    appended = None
+    if entry is not None:
+        appended = fetch_appended_transactions(entry["state"])
+    if appended is not None:
+        new_rows, state = appended
+        df = concat_transactions(entry["df"], new_rows).reset_index(drop=True)
+    else:
+        df, state = _read_main_csv()
+    _write_cache(BASE_CACHE_LOC, key, df, state=state)
+    return df, state
+
+
+def read_override_layer(overrides_df: pd.DataFrame) -> dict:
+    """Typed, non-missing override values as {transaction_id: {column: value}}"""
+    overrides_df = _apply_schema(overrides_df, keep_missing=True)
+    layer = {}
+    for row in overrides_df.to_dict("records"):
+        values = layer.setdefault(row.pop("transaction_id"), {})
+        for col, value in row.items():
+            if not pd.isna(value):
+                values[col] = int(value) if col == "amount" else value
+    return layer
+
+
+def transaction_positions(df: pd.DataFrame) -> dict:
+    """transaction_id -> row position in df (of its first row if it repeats)"""
+    ids = df["transaction_id"]
+    first = ~ids.duplicated().to_numpy()
+    return dict(zip(ids.to_numpy()[first].tolist(), np.flatnonzero(first).tolist()))
+
+
+def apply_overrides(df: pd.DataFrame, overrides: dict, positions=None) -> dict:
+    """Overwrite overridden transactions' fields in df (in place) with the override layer
+
+    positions is df's transaction_positions, built if not given. Returns the
+    base layer values that were overwritten, in the same
+    {transaction_id: {column: value}} shape, so overrides can be undone later.
+    """
+    if positions is None:
+        positions = transaction_positions(df)
+    base_values = {}
+    for transaction_id, values in overrides.items():
+        position = positions.get(transaction_id)
+        if position is None:
+            continue
+        values = {col: value for col, value in values.items() if col in df.columns}
+        base_values[transaction_id] = {col: df[col].iat[position] for col in values}
+        for col, value in values.items():
+            set_column_values(df, col, [position], [value])
+    return base_values
+
+
+def select_purchases(df: pd.DataFrame) -> pd.DataFrame:
+    """Purchases (positive amounts) sorted by date, which lets months and date
+    ranges be selected as slices"""
+    return df[df.amount > 0].sort_values("date", kind="stable")
+
+
+def add_derived_columns(df: pd.DataFrame) -> pd.DataFrame:
     df["Month"] = df["date"].dt.to_period("M")
     return df
 
 
-def fetch_csv_last_modified():
-    main_mod_time = os.path.getmtime(MAIN_DATA_LOC)
-    overrides_mod_time = os.path.getmtime(OVERRIDES_LOC)
-    return max(main_mod_time, overrides_mod_time)
+# A transactions frame with the layers it was built from: the override layer
+# applied on top of it and the base layer values those overrides replaced
+LoadedTransactions = namedtuple(
+    "LoadedTransactions", ["df", "ingest_state", "overrides", "base_values"]
+)
+
+
+def load_transactions() -> LoadedTransactions:
+    """Load the merged transactions frame along with the ingest state of transactions.csv"""
+    key = fetch_data_fingerprints()
+    entry = _load_cache_entry(MERGED_CACHE_LOC)
+    if entry is not None and entry["key"] == key:
+        return LoadedTransactions(
+            entry["df"], entry["state"], entry["overrides"], entry["base_values"]
+        )
+
+    df, state = _fetch_base_df()
+    overrides = read_override_layer(get_override_store().read())
+    base_values = apply_overrides(df, overrides)
+    add_derived_columns(df)
+
+    _write_cache(
+        MERGED_CACHE_LOC,
+        key,
+        df,
+        state=state,
+        overrides=overrides,
+        base_values=base_values,
+    )
+    return LoadedTransactions(df, state, overrides, base_values)
+
+
+def fetch_appended_transaction_df(state: dict) -> Optional[LoadedTransactions]:
+    """Appended rows with overrides applied, see fetch_appended_transactions"""
+    appended = fetch_appended_transactions(state)
+    if appended is None:
+        return None
+    new_rows, new_state = appended
+    overrides = read_override_layer(get_override_store().read())
+    base_values = apply_overrides(new_rows, overrides) if len(new_rows) > 0 else {}
+    return LoadedTransactions(
+        add_derived_columns(new_rows), new_state, overrides, base_values
+    )
+
+
+def fetch_data_fingerprints():
+    """Fingerprints of transactions.csv and the override store, see file_fingerprint"""
+    return file_fingerprint(MAIN_DATA_LOC), get_override_store().fingerprint()
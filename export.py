@@ -0,0 +1,104 @@
+import io
+import pandas as pd
+from config import EXPORT_BATCH_ROWS
+from overrides_helpers import CATEGORY_COL
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional, only needed for Parquet exports
+    pyarrow = None
+
+# Exported column -> purchases column
+EXPORT_COLUMNS = {
+    "transaction_id": "transaction_id",
+    "date": "date",
+    "name": "name",
+    "merchant": "merchant_name",
+    "amount": "amount",
+    "category": CATEGORY_COL,
+    "account": "account_id",
+}
+
+
+def _batches(rows: pd.DataFrame, lock):
+    """rows in EXPORT_BATCH_ROWS sized frames of the exported columns, amounts in
+    dollars. Each is copied under lock as edits patch rows in place."""
+    # At least one, possibly empty, batch so the output always has a header
+    for start in range(0, max(len(rows), 1), EXPORT_BATCH_ROWS):
+        with lock:
+            batch = rows.iloc[start : start + EXPORT_BATCH_ROWS][
+                list(EXPORT_COLUMNS.values())
+            ].copy()
+        batch.columns = list(EXPORT_COLUMNS)
+        batch["amount"] = batch["amount"] / 100
+        yield batch
+
+
+def _csv_chunks(batches):
+    for i, batch in enumerate(batches):
+        yield batch.to_csv(
+            index=False, header=i == 0, date_format="%Y-%m-%d", float_format="%.2f"
+        )
+
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        batch["date"] = batch["date"].dt.strftime("%Y-%m-%d")
+        if len(batch):
+            yield batch.to_json(orient="records", lines=True)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what is written until drained, keeping track of
+    the position as Parquet's footer refers to offsets in the whole file"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _parquet_chunks(batches):
+    """One row group per batch, each sent as soon as it is written"""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        table = pyarrow.Table.from_pandas(batch, preserve_index=False)
+        if writer is None:
+            writer = pyarrow.parquet.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+# Format -> (chunk writer, mimetype)
+EXPORT_FORMATS = {
+    "csv": (_csv_chunks, "text/csv"),
+    "ndjson": (_ndjson_chunks, "application/x-ndjson"),
+}
+if pyarrow is not None:
+    EXPORT_FORMATS["parquet"] = (_parquet_chunks, "application/vnd.apache.parquet")
+
+
+def export_chunks(rows: pd.DataFrame, export_format, lock):
+    """rows in an EXPORT_FORMATS format, generated a batch at a time so only one
+    batch of output is in memory however many rows there are"""
+    write_chunks, _ = EXPORT_FORMATS[export_format]
+    return write_chunks(_batches(rows, lock))
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+from budgets import BUCKET_BITS, BUCKET_COL
+
+
+def daily_spend(rows: pd.DataFrame, budget_names, months) -> np.ndarray:
+    """Spend (in cents) of rows per budget, month and day of month, as an array of
+    shape (budgets, months, 31), in a single np.bincount"""
+    month_count = len(months)
+    month_index = rows["Month"].array.asi8 - months[0].ordinal
+    day_index = rows["date"].dt.day.to_numpy() - 1
+    in_months = (month_index >= 0) & (month_index < month_count)
+    bits = np.array([BUCKET_BITS[name] for name in budget_names], dtype="int64")
+    # (row, budget) pairs of every row counting towards a budget
+    row_i, budget_i = np.nonzero(
+        ((rows[BUCKET_COL].to_numpy()[:, None] & bits) != 0) & in_months[:, None]
+    )
+    cells = (budget_i * month_count + month_index[row_i]) * 31 + day_index[row_i]
+    spend = np.bincount(
+        cells,
+        weights=rows["amount"].to_numpy()[row_i],
+        minlength=len(bits) * month_count * 31,
+    )
+    return spend.reshape(len(bits), month_count, 31)
+
+
+def forecast_budgets(rows: pd.DataFrame, budgets: dict, today=None) -> dict:
+    """Projected end of month spend (in dollars) and whether it stays within
+    budget, {budget: (projected, on_pace)}, for the month of today
+
+    Spend so far is scaled by the share of a month's spend that past months
+    (all months of rows before this one) had reached by the same day, or by the
+    share of the month gone by for budgets without any past spend.
+    """
+    today = pd.Timestamp.now() if today is None else pd.Timestamp(today)
+    current = pd.Period(today, freq="M")
+    if len(rows) == 0:
+        return {}
+    first = min(pd.Period(rows["date"].min(), freq="M"), current)
+    months = list(pd.period_range(first, current, freq="M"))
+    names = list(budgets)
+
+    # Cumulative spend by day of month, the current month is the last
+    cumulative = daily_spend(rows, names, months).cumsum(axis=2)
+    day = today.day - 1
+    spent = cumulative[:, -1, day]
+    history = cumulative[:, :-1, :]
+    spent_by_day = history[:, :, day].sum(axis=1)
+    month_totals = history[:, :, -1].sum(axis=1)
+    month_count = history.shape[1]
+
+    # Budgets without history extrapolate linearly, and those whose history
+    # spent nothing by today add a typical month's remaining spend instead
+    share = np.divide(
+        spent_by_day,
+        month_totals,
+        out=np.zeros_like(spent_by_day),
+        where=month_totals > 0,
+    )
+    scaled = np.where(
+        share > 0,
+        spent / np.where(share > 0, share, 1),
+        spent + (month_totals - spent_by_day) / max(month_count, 1),
+    )
+    linear = spent * today.days_in_month / today.day
+    projected = np.where(month_totals > 0, scaled, linear)
+    projected = np.maximum(projected, spent) / 100
+    return {
+        name: (float(amount), bool(amount <= budgets[name]))
+        for name, amount in zip(names, projected)
+    }
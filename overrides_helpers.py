@@ -1,51 +1,259 @@
 import pandas as pd
 from typing import Optional
-from config import MAIN_DATA_LOC, OVERRIDES_LOC
+from config import OVERRIDES_LOC, OVERRIDES_BACKEND, OVERRIDES_DB_LOC
+from contextlib import contextmanager
+import fcntl
+import os
+import sqlite3
+import sys
+import time
 
+CATEGORY_COL = "personal_finance_category.primary"
 
-def get_maindata_row_by_transaction_id(transaction_id) -> pd.Series:
-    df = pd.read_csv(MAIN_DATA_LOC)
-    row = df[df["transaction_id"] == transaction_id]
-    return row
 
+class CsvOverrideStore:
+    """Overrides kept in overrides.csv, every edit rewrites the whole file
 
-def read_overrides() -> pd.DataFrame:
-    return pd.read_csv(OVERRIDES_LOC)
+    Edits take an exclusive lock on a sidecar lock file and replace the CSV
+    atomically, so concurrent edits from several workers don't clobber each other.
+    """
 
+    def __init__(self, path=OVERRIDES_LOC):
+        self.path = path
+        self.lock_path = path + ".lock"
 
-def delete_override(transaction_id: str) -> None:
-    """Delete an override for a specific transaction if it exists"""
-    overrides_df = read_overrides()
+    def fingerprint(self) -> tuple:
+        """(location, version, modified time in ns) - changes on every edit"""
+        stat = os.stat(self.path)
+        return (os.path.abspath(self.path), stat.st_size, stat.st_mtime_ns)
 
-    if transaction_id in overrides_df["transaction_id"].values:
-        overrides_df = overrides_df[overrides_df["transaction_id"] != transaction_id]
-        overrides_df.to_csv(OVERRIDES_LOC, index=False)
+    def read(self) -> pd.DataFrame:
+        return pd.read_csv(self.path)
+
+    def _locked(self):
+        lock_file = open(self.lock_path, "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _write(self, overrides_df: pd.DataFrame) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        overrides_df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+    def delete(self, transaction_id: str) -> tuple:
+        with self._locked():
+            before = self.fingerprint()
+            overrides_df = self.read()
+            if transaction_id in overrides_df["transaction_id"].values:
+                overrides_df = overrides_df[
+                    overrides_df["transaction_id"] != transaction_id
+                ]
+                self._write(overrides_df)
+            return before, self.fingerprint()
+
+    def upsert(
+        self,
+        transaction_id: str,
+        new_amount: Optional[float] = None,
+        new_category: Optional[str] = None,
+    ) -> tuple:
+        with self._locked():
+            before = self.fingerprint()
+            overrides_df = self.read()
+
+            # Check if the transaction_id already exists
+            if transaction_id not in overrides_df["transaction_id"].values:
+                # Fields left empty are ignored when overrides are applied, so
+                # there is no need to copy the rest of the row from the main data
+                new_row = pd.DataFrame({"transaction_id": [transaction_id]})
+                overrides_df = pd.concat([overrides_df, new_row], ignore_index=True)
+
+            is_row = overrides_df["transaction_id"] == transaction_id
+            if new_amount is not None:
+                overrides_df.loc[is_row, "amount"] = new_amount
+            if new_category is not None:
+                overrides_df.loc[is_row, CATEGORY_COL] = new_category
+
+            self._write(overrides_df)
+            return before, self.fingerprint()
+
+    def export_csv(self, path) -> None:
+        self.read().to_csv(path, index=False)
+
+
+class SqliteOverrideStore:
+    """Overrides keyed by transaction_id in an embedded SQLite database
+
+    Each edit touches a single row, so its cost doesn't grow with the number of
+    overrides. SQLite serializes writers across processes. Edits only set the
+    amount and category, other columns of an imported overrides.csv are kept as
+    extra text columns.
+    """
+
+    def __init__(self, path=OVERRIDES_DB_LOC, import_csv=OVERRIDES_LOC):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS overrides ("
+                "transaction_id TEXT PRIMARY KEY, amount REAL, category TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS revision ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "revision INTEGER NOT NULL, modified_ns INTEGER NOT NULL)"
+            )
+            is_new = (
+                conn.execute(
+                    "INSERT OR IGNORE INTO revision VALUES (0, 0, ?)", (time.time_ns(),)
+                ).rowcount
+                == 1
+            )
+        if is_new and import_csv and os.path.exists(import_csv):
+            self._import_csv(import_csv)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success. Connections are cheap and not
+        shareable across threads, so each operation opens its own"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump_revision(self, conn) -> None:
+        conn.execute(
+            "UPDATE revision SET revision = revision + 1, modified_ns = ?",
+            (time.time_ns(),),
+        )
+
+    def _import_csv(self, path) -> None:
+        # As text, so other columns are stored as written
+        overrides_df = pd.read_csv(path, dtype=str)
+        overrides_df = overrides_df.astype(object).where(overrides_df.notna(), None)
+        extra = [
+            col
+            for col in overrides_df.columns
+            if col not in ("transaction_id", "amount", CATEGORY_COL)
+        ]
+        if "category" in [col.lower() for col in extra]:
+            # SQLite names are case-insensitive, it would clash with CATEGORY_COL's
+            raise ValueError(f"{path} has a category column, rename it to import it")
+        rows = [
+            (
+                row["transaction_id"],
+                None if row.get("amount") is None else float(row["amount"]),
+                row.get(CATEGORY_COL),
+                *(row[col] for col in extra),
+            )
+            for row in overrides_df.to_dict("records")
+        ]
+        columns = ", ".join(
+            ["transaction_id", "amount", "category"] + [_quote(col) for col in extra]
+        )
+        placeholders = ", ".join("?" * (3 + len(extra)))
+        with self._connect() as conn:
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(overrides)")}
+            for col in extra:
+                if col not in existing:
+                    conn.execute(f"ALTER TABLE overrides ADD COLUMN {_quote(col)} TEXT")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO overrides ({columns}) VALUES ({placeholders})",
+                rows,
+            )
+            self._bump_revision(conn)
+
+    def fingerprint(self) -> tuple:
+        """(location, version, modified time in ns) - changes on every edit"""
+        with self._connect() as conn:
+            return self._fingerprint(conn)
+
+    def _fingerprint(self, conn) -> tuple:
+        revision, modified_ns = conn.execute(
+            "SELECT revision, modified_ns FROM revision"
+        ).fetchone()
+        return (os.path.abspath(self.path), revision, modified_ns)
+
+    def read(self) -> pd.DataFrame:
+        with self._connect() as conn:
+            return pd.read_sql_query("SELECT * FROM overrides", conn).rename(
+                columns={"category": CATEGORY_COL}
+            )
+
+    def delete(self, transaction_id: str) -> tuple:
+        with self._connect() as conn:
+            # Holds the write lock from here, so no other edit lands in between
+            conn.execute("BEGIN IMMEDIATE")
+            before = self._fingerprint(conn)
+            deleted = conn.execute(
+                "DELETE FROM overrides WHERE transaction_id = ?", (transaction_id,)
+            ).rowcount
+            if deleted:
+                self._bump_revision(conn)
+            return before, self._fingerprint(conn)
+
+    def upsert(
+        self,
+        transaction_id: str,
+        new_amount: Optional[float] = None,
+        new_category: Optional[str] = None,
+    ) -> None:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = self._fingerprint(conn)
+            conn.execute(
+                "INSERT INTO overrides (transaction_id, amount, category) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT (transaction_id) DO UPDATE SET "
+                "amount = COALESCE(excluded.amount, amount), "
+                "category = COALESCE(excluded.category, category)",
+                (transaction_id, new_amount, new_category),
+            )
+            self._bump_revision(conn)
+            return before, self._fingerprint(conn)
+
+    def export_csv(self, path) -> None:
+        self.read().to_csv(path, index=False)
+
+
+def _quote(identifier) -> str:
+    """identifier as a quoted SQL identifier, e.g. for column names from a CSV"""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+OVERRIDE_BACKENDS = {"csv": CsvOverrideStore, "sqlite": SqliteOverrideStore}
+_override_store = None
+
+
+def get_override_store():
+    """The override store selected by OVERRIDES_BACKEND"""
+    global _override_store
+    if _override_store is None:
+        _override_store = OVERRIDE_BACKENDS[OVERRIDES_BACKEND]()
+    return _override_store
+
+
+def delete_override(transaction_id: str) -> tuple:
+    """Delete an override for a specific transaction if it exists
+
+    Returns the store's fingerprints just before and after, see
+    TransactionData.record_override_write.
+    """
+    return get_override_store().delete(transaction_id)
 
 
 def upsert_override(
     transaction_id: str,
     new_amount: Optional[float] = None,
     new_category: Optional[str] = None,
-) -> None:
-    """Possibly add then update an override for a specific transaction"""
-    overrides_df = read_overrides()
-
-    # Check if the transaction_id already exists
-    if transaction_id not in overrides_df["transaction_id"].values:
-        # Add new override as copy from main data
-        new_row = get_maindata_row_by_transaction_id(transaction_id)
-        overrides_df = pd.concat([overrides_df, pd.DataFrame(new_row)])
-
-    if new_amount is not None:
-        overrides_df.loc[overrides_df["transaction_id"] == transaction_id, "amount"] = (
-            new_amount
-        )
+) -> tuple:
+    """Possibly add then update an override for a specific transaction, returns
+    the store's fingerprints just before and after (see delete_override)"""
+    return get_override_store().upsert(transaction_id, new_amount, new_category)
 
-    if new_category is not None:
-        overrides_df.loc[
-            overrides_df["transaction_id"] == transaction_id,
-            "personal_finance_category.primary",
-        ] = new_category
 
-    # Save back to CSV
-    overrides_df.to_csv(OVERRIDES_LOC, index=False)
+if __name__ == "__main__":
+    # Export the current overrides back to CSV, e.g. from the SQLite backend
+    get_override_store().export_csv(sys.argv[1] if len(sys.argv) > 1 else OVERRIDES_LOC)
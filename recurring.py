@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+from dash import html
+
+# Cadence -> (shortest interval, longest interval, fewest charges), in days
+CADENCES = {
+    "Weekly": (5, 9, 4),
+    "Monthly": (26, 35, 3),
+    "Annual": (350, 380, 3),
+}
+# Share of a merchant's charges in an amount band that must be a cadence apart
+MIN_CADENCE_SHARE = 0.75
+# Relative width of the amount bands, charges of a subscription vary less
+AMOUNT_BAND = 0.1
+# Punctuation, then words with digits such as store numbers, e.g. "Starbucks #243"
+# and "STARBUCKS 243" are both "starbucks"
+MERCHANT_PUNCTUATION = r"[^\w\s&']"
+MERCHANT_NUMBERS = r"\w*\d\w*"
+
+RECURRING_COLUMNS = ["merchant", "cadence", "amount", "charges", "last", "next"]
+
+
+def _merchant_keys(rows: pd.DataFrame):
+    """Normalized merchant of each row (the merchant name, or the description if
+    there is none) as a number, and the display name of each number
+
+    Only the distinct names are normalized, not every row.
+    """
+    merchants = rows["merchant_name"].astype("category")
+    names = rows["name"].astype("category")
+    merchant_names = merchants.cat.categories.astype(str)
+    stripped = (
+        pd.Series(np.concatenate([merchant_names, names.cat.categories.astype(str)]))
+        .str.replace(MERCHANT_PUNCTUATION, " ", regex=True)
+        .str.replace(MERCHANT_NUMBERS, " ", regex=True)
+        .str.split()
+        .str.join(" ")
+    )
+    labels, _ = pd.factorize(stripped.str.lower())
+    merchant_codes = merchants.cat.codes.to_numpy()
+    name_codes = names.cat.codes.to_numpy()
+    # Missing merchants are loaded as "nan" (see datafetchers), code -1 is missing too
+    has_merchant = np.append(~merchant_names.isin(["nan", ""]), False)
+    keys = np.where(
+        has_merchant[merchant_codes],
+        labels[merchant_codes],
+        labels[len(merchants.cat.categories) + name_codes],
+    )
+    return keys, stripped.groupby(labels).first()
+
+
+def detect_recurring(rows: pd.DataFrame, as_of=None) -> pd.DataFrame:
+    """Recurring charges among rows, one per merchant and amount band whose charges
+    are mostly a CADENCES interval apart and that is still charging as of as_of
+    (the latest date of rows by default)
+
+    Vectorized over all rows: intervals come from one sort by (merchant, band,
+    date) and the statistics of each group from np.bincount.
+    """
+    rows = rows[rows["amount"] > 0]
+    if len(rows) == 0:
+        return pd.DataFrame(columns=RECURRING_COLUMNS)
+    keys, display_names = _merchant_keys(rows)
+    amounts = rows["amount"].to_numpy()
+    bands = np.floor(np.log(amounts) / np.log1p(AMOUNT_BAND)).astype("int64")
+    groups, _ = pd.factorize(keys * (bands.max() + 1) + bands)
+    days = rows["date"].to_numpy().astype("datetime64[D]").astype("int64")
+
+    order = np.lexsort((days, groups))
+    groups = groups[order]
+    days = days[order]
+    keys = keys[order]
+    amounts = amounts[order]
+    group_count = groups.max() + 1
+    charges = np.bincount(groups, minlength=group_count)
+    # Rows are sorted by group, so each group's last row is before the next group
+    last = np.r_[np.flatnonzero(groups[1:] != groups[:-1]), len(groups) - 1]
+
+    # Days since the group's previous charge, same day charges don't count
+    intervals = np.diff(days)
+    interval_groups = groups[1:]
+    counted = (interval_groups == groups[:-1]) & (intervals > 0)
+    interval_count = np.bincount(
+        interval_groups[counted], minlength=group_count
+    ).astype("float64")
+
+    best_share = np.zeros(group_count)
+    cadence = np.full(group_count, -1)
+    period = np.zeros(group_count)
+    for i, (shortest, longest, fewest) in enumerate(CADENCES.values()):
+        fits = counted & (intervals >= shortest) & (intervals <= longest)
+        hits = np.bincount(interval_groups[fits], minlength=group_count)
+        share = np.divide(
+            hits, interval_count, out=np.zeros(group_count), where=interval_count > 0
+        )
+        better = (share > best_share) & (hits >= fewest - 1)
+        best_share = np.where(better, share, best_share)
+        cadence = np.where(better, i, cadence)
+        period = np.where(
+            better,
+            np.bincount(
+                interval_groups[fits], weights=intervals[fits], minlength=group_count
+            )
+            / np.maximum(hits, 1),
+            period,
+        )
+
+    if as_of is None:
+        as_of = days.max()
+    else:
+        as_of = np.datetime64(pd.Timestamp(as_of).date(), "D").astype("int64")
+    next_days = days[last] + np.rint(period).astype("int64")
+    # Missing more than one charge means it stopped
+    recurring = (best_share >= MIN_CADENCE_SHARE) & (next_days + period >= as_of)
+    found = np.flatnonzero(recurring)
+    return (
+        pd.DataFrame(
+            {
+                "merchant": display_names.to_numpy()[keys[last[found]]],
+                "cadence": np.array(list(CADENCES))[cadence[found]],
+                "amount": amounts[last[found]] / 100,
+                "charges": charges[found],
+                "last": days[last[found]].astype("datetime64[D]"),
+                "next": next_days[found].astype("datetime64[D]"),
+            },
+            columns=RECURRING_COLUMNS,
+        )
+        .sort_values(["next", "merchant"])
+        .reset_index(drop=True)
+    )
+
+
+def build_recurring_table(recurring: pd.DataFrame):
+    """Table of detect_recurring's charges"""
+    if len(recurring) == 0:
+        return html.Div("No recurring charges found.")
+    cell = {"padding": "12px", "borderBottom": "1px solid #e2e8f0"}
+    header = {
+        "textAlign": "left",
+        "padding": "12px",
+        "borderBottom": "2px solid #e2e8f0",
+        "color": "#4a5568",
+        "fontWeight": "600",
+    }
+    return html.Div(
+        html.Table(
+            [
+                html.Thead(
+                    html.Tr(
+                        [
+                            html.Th(col, style=header)
+                            for col in [
+                                "Merchant",
+                                "Cadence",
+                                "Amount",
+                                "Charges",
+                                "Last Charge",
+                                "Next Expected",
+                            ]
+                        ]
+                    )
+                ),
+                html.Tbody(
+                    [
+                        html.Tr(
+                            [
+                                html.Td(row.merchant, style=cell),
+                                html.Td(row.cadence, style=cell),
+                                html.Td(f"${row.amount:,.2f}", style=cell),
+                                html.Td(row.charges, style=cell),
+                                html.Td(row.last.strftime("%Y-%m-%d"), style=cell),
+                                html.Td(row.next.strftime("%Y-%m-%d"), style=cell),
+                            ]
+                        )
+                        for row in recurring.itertuples()
+                    ]
+                ),
+            ],
+            style={
+                "width": "100%",
+                "borderCollapse": "collapse",
+                "backgroundColor": "white",
+            },
+        ),
+        style={
+            "borderRadius": "10px",
+            "overflow": "auto",
+            "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)",
+            "backgroundColor": "white",
+        },
+    )
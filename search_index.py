@@ -0,0 +1,69 @@
+from collections import defaultdict
+import pandas as pd
+
+# Transaction columns the search box looks in
+SEARCH_COLUMNS = ["merchant_name", "name"]
+
+
+def normalize_query(query) -> str:
+    """The form of a search box value that searches and cache keys use"""
+    return (query or "").strip().lower()
+
+
+def _trigrams(text) -> set:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Case-insensitive substring search over a growing set of strings
+
+    Strings are indexed by their trigrams (three character substrings), so a
+    query only checks the strings containing all of its trigrams. Columns are
+    categorical, so indexing their categories covers every row.
+    """
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self.lowered = []
+        # String -> position in self.strings, and trigram -> positions
+        self.ids = {}
+        self.postings = defaultdict(list)
+        self.add(strings)
+
+    def add(self, strings) -> None:
+        """Index strings that aren't indexed yet"""
+        for string in strings:
+            if string in self.ids:
+                continue
+            string_id = self.ids[string] = len(self.strings)
+            lowered = string.lower()
+            self.strings.append(string)
+            self.lowered.append(lowered)
+            for trigram in _trigrams(lowered):
+                self.postings[trigram].append(string_id)
+
+    def search(self, query) -> list:
+        """The indexed strings containing query (see normalize_query)"""
+        if len(query) < 3:
+            # No trigrams to narrow it down, but still only the distinct strings
+            candidates = range(len(self.strings))
+        else:
+            postings = sorted(
+                (self.postings.get(trigram, []) for trigram in _trigrams(query)),
+                key=len,
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return [self.strings[i] for i in candidates if query in self.lowered[i]]
+
+
+def _column_values(values: pd.Series):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.categories.astype(str)
+    return values.astype(str).unique()
+
+
+def build_search_index(df: pd.DataFrame) -> TrigramIndex:
+    """A TrigramIndex of the values of df's SEARCH_COLUMNS"""
+    return TrigramIndex(
+        value for col in SEARCH_COLUMNS for value in _column_values(df[col])
+    )
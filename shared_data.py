@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+from config import MAIN_DATA_LOC, DATA_PLANE_DIR
+from datafetchers import (
+    file_fingerprint,
+    load_transactions,
+    select_purchases,
+    LoadedTransactions,
+)
+from contextlib import contextmanager
+import fcntl
+import os
+import pickle
+import re
+import shutil
+
+CURRENT_LOC = os.path.join(DATA_PLANE_DIR, "CURRENT")
+LOCK_LOC = os.path.join(DATA_PLANE_DIR, ".lock")
+# Bump when what gets published changes so older versions are republished
+PLANE_VERSION = 3
+# Names of the version directories _publish writes, the only ones it deletes
+VERSION_NAME = re.compile(r"v\d+_\d+(\.tmp)?")
+
+
+@contextmanager
+def _plane_lock():
+    """Exclusive across worker processes, so only one of them loads and publishes"""
+    os.makedirs(DATA_PLANE_DIR, exist_ok=True)
+    with open(LOCK_LOC, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _write_frame(directory, name, df: pd.DataFrame) -> dict:
+    """Write each column of df as its own .npy file, returning how to read them back"""
+    columns = []
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            kind, extra = "category", list(values.cat.categories)
+            array = values.cat.codes.to_numpy()
+        elif isinstance(values.dtype, pd.PeriodDtype):
+            kind, extra = "period", values.dtype.freq
+            array = values.array.asi8
+        elif pd.api.types.is_datetime64_dtype(values.dtype):
+            # Saved as plain int64, .npy doesn't keep the dtype's metadata
+            kind, extra = "datetime", str(values.dtype)
+            array = values.to_numpy().view("int64")
+        elif values.dtype == object:
+            # Variable width strings can't be mapped, so they are mapped as codes
+            # into their distinct values, saved as fixed width strings
+            kind, extra = "strings", None
+            values = pd.Categorical(values.astype(str))
+            array = values.codes
+            np.save(
+                os.path.join(directory, f"{name}_{i}_strings.npy"),
+                values.categories.to_numpy(dtype=str),
+            )
+        else:
+            kind, extra, array = "array", None, values.to_numpy()
+        np.save(os.path.join(directory, f"{name}_{i}.npy"), array)
+        columns.append((col, kind, extra))
+    np.save(os.path.join(directory, f"{name}_index.npy"), df.index.to_numpy())
+    return {"name": name, "columns": columns}
+
+
+def _read_frame(directory, frame_meta: dict) -> pd.DataFrame:
+    """Map a frame written by _write_frame
+
+    Files are mapped copy-on-write: workers share the pages until one of them
+    patches a value, which then only changes that worker's copy.
+    """
+    name = frame_meta["name"]
+    data = {}
+    for i, (col, kind, extra) in enumerate(frame_meta["columns"]):
+        array = np.load(os.path.join(directory, f"{name}_{i}.npy"), mmap_mode="c")
+        if kind == "category":
+            data[col] = pd.Categorical.from_codes(array, categories=extra)
+        elif kind == "strings":
+            strings = np.load(
+                os.path.join(directory, f"{name}_{i}_strings.npy"), mmap_mode="r"
+            )
+            data[col] = pd.Categorical.from_codes(
+                array, categories=strings.astype(object)
+            )
+        elif kind == "datetime":
+            data[col] = array.view(extra)
+        elif kind == "period":
+            data[col] = pd.arrays.PeriodArray(array, dtype=pd.PeriodDtype(extra))
+        else:
+            data[col] = array
+    index = np.load(os.path.join(directory, f"{name}_index.npy"), mmap_mode="c")
+    return pd.DataFrame(data, index=pd.Index(index), copy=False)
+
+
+def _publish(key, loaded: LoadedTransactions, purchases_df: pd.DataFrame) -> None:
+    """Write a new version and atomically point CURRENT at it"""
+    version = f"v{os.getpid()}_{pd.Timestamp.now().value}"
+    # Written under a temporary name so a failed publish is never mapped
+    directory = os.path.join(DATA_PLANE_DIR, version + ".tmp")
+    os.makedirs(directory)
+    meta = {
+        "key": key,
+        "frames": [
+            _write_frame(directory, "df", loaded.df),
+            _write_frame(directory, "purchases", purchases_df),
+        ],
+        "ingest_state": loaded.ingest_state,
+        "overrides": loaded.overrides,
+        "base_values": loaded.base_values,
+    }
+    with open(os.path.join(directory, "meta.pkl"), "wb") as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(directory, os.path.join(DATA_PLANE_DIR, version))
+
+    tmp_loc = f"{CURRENT_LOC}.{os.getpid()}.tmp"
+    with open(tmp_loc, "w") as f:
+        f.write(version)
+    os.replace(tmp_loc, CURRENT_LOC)
+
+    # Workers still mapping older versions keep their mappings after the unlink.
+    # Other publishes can't be in progress, they hold the same lock.
+    for entry in os.listdir(DATA_PLANE_DIR):
+        path = os.path.join(DATA_PLANE_DIR, entry)
+        if (
+            entry != version
+            and VERSION_NAME.fullmatch(entry)
+            and os.path.isdir(path)
+            and not os.path.islink(path)
+        ):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _read_current():
+    """(directory, metadata) of the published version, or None"""
+    try:
+        with open(CURRENT_LOC) as f:
+            directory = os.path.join(DATA_PLANE_DIR, f.read().strip())
+        with open(os.path.join(directory, "meta.pkl"), "rb") as f:
+            return directory, pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def load_shared_transactions():
+    """Map the published transactions, loading and publishing them first if they
+    are missing or older than transactions.csv
+
+    Returns (LoadedTransactions, purchases_df). The overrides are those at
+    publish time, callers should sync them with the override store.
+    """
+    with _plane_lock():
+        key = (PLANE_VERSION, file_fingerprint(MAIN_DATA_LOC))
+        current = _read_current()
+        if current is None or current[1]["key"] != key:
+            print(f"Worker {os.getpid()}: publishing transactions")
+            loaded = load_transactions()
+            purchases_df = select_purchases(loaded.df)
+            _publish(key, loaded, purchases_df)
+            current = _read_current()
+
+        directory, meta = current
+        df, purchases_df = (_read_frame(directory, frame) for frame in meta["frames"])
+    loaded = LoadedTransactions(
+        df, meta["ingest_state"], meta["overrides"], meta["base_values"]
+    )
+    return loaded, purchases_df
@@ -0,0 +1,54 @@
+import re
+import pandas as pd
+
+# Timespan values other than month names (e.g. "August 2025")
+YEAR_TO_DATE = "Year to Date"
+CUSTOM_RANGE = "Custom Range"
+TRAILING_DAYS = [30, 90, 365, 730]
+LAST_N_DAYS = re.compile(r"Last (\d+) Days")
+QUARTER = re.compile(r"Q([1-4]) (\d{4})")
+# What the custom range picker selects, both dates included
+DATE_RANGE = re.compile(r"(\d{4}-\d{2}-\d{2})/(\d{4}-\d{2}-\d{2})")
+
+
+def timespan_options(month_by_name: dict) -> list:
+    """Timespan dropdown options: every month, every quarter, then spans relative
+    to today and a custom range"""
+    quarters = sorted({month.asfreq("Q") for month in month_by_name.values()})
+    values = (
+        list(month_by_name)
+        + [f"Q{quarter.quarter} {quarter.year}" for quarter in quarters]
+        + [YEAR_TO_DATE]
+        + [f"Last {days} Days" for days in TRAILING_DAYS]
+        + [CUSTOM_RANGE]
+    )
+    return [{"label": value, "value": value} for value in values]
+
+
+def timespan_range(timespan_value, month_by_name: dict):
+    """(start, end) of a timespan, end excluded and None for up to now, or None
+    for values that aren't a timespan (e.g. CUSTOM_RANGE before dates are picked)"""
+    if timespan_value in month_by_name:
+        month = month_by_name[timespan_value]
+        return month.start_time, (month + 1).start_time
+    if timespan_value is None:
+        return None
+    if timespan_value == YEAR_TO_DATE:
+        return pd.Timestamp.now().normalize().replace(month=1, day=1), None
+    if match := LAST_N_DAYS.fullmatch(timespan_value):
+        return pd.Timestamp.now() - pd.DateOffset(days=int(match[1])), None
+    if match := QUARTER.fullmatch(timespan_value):
+        quarter = pd.Period(year=int(match[2]), quarter=int(match[1]), freq="Q")
+        return quarter.start_time, (quarter + 1).start_time
+    if match := DATE_RANGE.fullmatch(timespan_value):
+        start, end = pd.Timestamp(match[1]), pd.Timestamp(match[2])
+        if start <= end:
+            return start, end + pd.Timedelta(days=1)
+    return None
+
+
+def is_relative(timespan_value) -> bool:
+    """Whether a timespan's range depends on today's date"""
+    return timespan_value == YEAR_TO_DATE or bool(
+        LAST_N_DAYS.fullmatch(timespan_value or "")
+    )
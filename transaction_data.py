@@ -0,0 +1,405 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from datafetchers import (
+    load_transactions,
+    fetch_appended_transaction_df,
+    fetch_data_fingerprints,
+    read_override_layer,
+    concat_transactions,
+    select_purchases,
+    set_column_values,
+    frame_memory_mb,
+    transaction_positions,
+)
+from overrides_helpers import get_override_store
+from aggregates import AggregateCube, aggregate
+from budgets import BUCKET_COL, BUCKET_INPUTS, bucket_mask
+from search_index import SEARCH_COLUMNS, build_search_index
+from shared_data import load_shared_transactions
+from config import SHARED_DATA_PLANE
+
+
+class TransactionData:
+    """The loaded transactions, kept as a base layer (transactions.csv) with an
+    override layer on top
+
+    df is the base layer with overrides applied. Edits patch single rows of it
+    instead of reloading and only bump the version of the month they touch,
+    so anything derived from other months stays valid (see data_version).
+    """
+
+    def __init__(self):
+        # Held by readers for a consistent view, and while changes are applied
+        self.lock = threading.RLock()
+        # Serializes refreshes, which build new data without holding self.lock
+        self.refresh_lock = threading.Lock()
+
+        # Not necessary but just as a reminder these values get set on data fetch
+        self.df = None
+        # Sorted by date, see select_purchases
+        self.purchases_df = None
+        # Month -> slice of purchases_df with that month's purchases
+        self.month_slices = None
+        self.cube = None
+        # Merchant names and descriptions, see search
+        self.search_index = None
+        # transaction_id -> row position in df
+        self.positions = {}
+        self.month_names = None
+        self.month_by_name = None
+        self.max_month = None
+        self.last_updated = None
+        # transaction_id -> {column: value} of the override layer, and of the
+        # base layer values those overrides replaced in df
+        self.overrides = {}
+        self.base_values = {}
+        # These are necessary as they get checked against the data files
+        self.fingerprints = None
+        self.ingest_state = None
+        # Bumped on any change, on loads/appends, and per Month on patches
+        self.version = 0
+        self.load_version = 0
+        self.month_versions = {}
+
+    def refresh(self) -> bool:
+        """Bring the data up to date with the files, returns whether anything changed
+
+        A reload is built without holding the lock and then swapped in, so
+        readers holding the lock keep a consistent snapshot and are only
+        blocked for the swap.
+        """
+        with self.refresh_lock:
+            fingerprints = fetch_data_fingerprints()
+            if fingerprints == self.fingerprints:
+                return False
+
+            main_changed = (
+                self.fingerprints is None or fingerprints[0] != self.fingerprints[0]
+            )
+            appended = None
+            if self.df is not None and main_changed and not SHARED_DATA_PLANE:
+                # Try to ingest just the rows appended to transactions.csv
+                appended = fetch_appended_transaction_df(self.ingest_state)
+
+            state = None
+            if SHARED_DATA_PLANE and main_changed:
+                # Map the copy published for all workers, then patch in any
+                # overrides made since it was published
+                state = _loaded_state(*load_shared_transactions())
+            elif self.df is None or (main_changed and appended is None):
+                print("Refreshing data!")
+                state = _loaded_state(load_transactions())
+
+            with self.lock:
+                if state is not None:
+                    self._swap(state)
+                    if SHARED_DATA_PLANE:
+                        self.sync_overrides(
+                            read_override_layer(get_override_store().read())
+                        )
+                elif appended is not None:
+                    print(f"Appending {len(appended.df)} new transactions")
+                    self._append(appended)
+                    self.sync_overrides(appended.overrides)
+                else:
+                    self.sync_overrides(
+                        read_override_layer(get_override_store().read())
+                    )
+
+                self.fingerprints = fingerprints
+                last_modified = max(fingerprint[2] for fingerprint in fingerprints)
+                last_updated_dt = pd.to_datetime(last_modified, unit="ns")
+                self.last_updated = last_updated_dt.strftime("%b %-d, %Y")
+            return True
+
+    def _swap(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.version += 1
+        self.load_version += 1
+        print(
+            f"Worker {os.getpid()}: {len(self.df)} transactions in "
+            f"{frame_memory_mb(self.df):.1f} MB, purchases in "
+            f"{frame_memory_mb(self.purchases_df):.1f} MB"
+            + (" mapped from the shared data plane" if SHARED_DATA_PLANE else "")
+        )
+
+    def _append(self, appended) -> None:
+        self.ingest_state = appended.ingest_state
+        new_rows = appended.df
+        if len(new_rows) == 0:
+            return
+        offset = len(self.df)
+        new_rows.index = pd.RangeIndex(offset, offset + len(new_rows))
+        for transaction_id, position in transaction_positions(new_rows).items():
+            self.positions.setdefault(transaction_id, offset + position)
+        new_rows[BUCKET_COL] = bucket_mask(new_rows)
+        new_purchases = select_purchases(new_rows)
+        self.df = concat_transactions(self.df, new_rows)
+        self._set_purchases(concat_transactions(self.purchases_df, new_purchases))
+        self.cube.add(new_purchases)
+        self.search_index.add(
+            value
+            for col in SEARCH_COLUMNS
+            for value in new_rows[col].astype(str).unique()
+        )
+        self.base_values.update(appended.base_values)
+        for transaction_id in appended.base_values:
+            self.overrides[transaction_id] = appended.overrides[transaction_id]
+        for name, value in _month_data(self.df).items():
+            setattr(self, name, value)
+        self.version += 1
+        self.load_version += 1
+
+    def data_version(self, month=None):
+        """Version of everything derived from the data, or just from one Month"""
+        if month is None:
+            return self.version
+        return (self.load_version, self.month_versions.get(month, 0))
+
+    def _set_purchases(self, purchases_df: pd.DataFrame) -> None:
+        if not purchases_df["date"].is_monotonic_increasing:
+            purchases_df = purchases_df.sort_values("date", kind="stable")
+        self.purchases_df = purchases_df
+        self.month_slices = _month_slices(purchases_df)
+
+    def _remove_purchase(self, label, month) -> None:
+        """Take one row out of purchases_df, keeping the month slices in step"""
+        at = self.purchases_df.index.get_loc(label)
+        count = len(self.purchases_df)
+        self.purchases_df = self.purchases_df.take(np.r_[0:at, at + 1 : count])
+        self._shift_month_slices(month, -1)
+
+    def _insert_purchase(self, position) -> None:
+        """Put df's row at position into purchases_df where select_purchases would
+        have: by date, then in df order among purchases of the same date"""
+        row = self.df.iloc[[position]]
+        dates = self.purchases_df["date"]
+        date = row["date"].iat[0]
+        first = dates.searchsorted(date, side="left")
+        last = dates.searchsorted(date, side="right")
+        at = first + self.purchases_df.index[first:last].searchsorted(row.index[0])
+        count = len(self.purchases_df)
+        self.purchases_df = concat_transactions(self.purchases_df, row).take(
+            np.r_[0:at, count, at:count]
+        )
+        self._shift_month_slices(row["Month"].iat[0], 1, at)
+
+    def _shift_month_slices(self, month, step, at=None) -> None:
+        """Grow (or shrink) month's slice by step rows, and move later months"""
+        slices = {}
+        for other, rows in self.month_slices.items():
+            if other == month:
+                rows = slice(rows.start, rows.stop + step)
+            elif other > month:
+                rows = slice(rows.start + step, rows.stop + step)
+            if rows.stop > rows.start:
+                slices[other] = rows
+        if month not in self.month_slices and step > 0:
+            slices[month] = slice(at, at + step)
+        self.month_slices = dict(sorted(slices.items()))
+
+    def month_purchases(self, month) -> pd.DataFrame:
+        """Purchases in one Month, oldest first"""
+        return self.purchases_df.iloc[self.month_slices.get(month, slice(0, 0))]
+
+    def purchases_between(self, start, end=None) -> pd.DataFrame:
+        """Purchases on or after start and before end (if given), oldest first"""
+        dates = self.purchases_df["date"]
+        first = dates.searchsorted(start)
+        last = len(dates) if end is None else dates.searchsorted(end)
+        return self.purchases_df.iloc[first:last]
+
+    def aggregate_between(self, start, end=None) -> pd.DataFrame:
+        """Purchases between start and end (see purchases_between) aggregated over
+        aggregates.CUBE_DIMENSIONS
+
+        Whole months come from the cube, so only the rows of the partial months
+        at either end get aggregated and long ranges cost about as much as one
+        month.
+        """
+        first_full = pd.Period(start, freq="M")
+        if start > first_full.start_time:
+            first_full += 1
+        # Up to the latest purchase every month from first_full on is whole
+        last_full = None if end is None else pd.Period(end, freq="M") - 1
+        if last_full is not None and last_full < first_full:
+            # Within a month (or two partial ones), just aggregate its rows
+            return aggregate(self.purchases_between(start, end))
+
+        edges = [self.purchases_between(start, first_full.start_time)]
+        if last_full is not None:
+            edges.append(self.purchases_between((last_full + 1).start_time, end))
+        months = [
+            month
+            for month in self.cube.months
+            if month >= first_full and (last_full is None or month <= last_full)
+        ]
+        # Both edges in one groupby
+        edges = pd.concat(edges)
+        return self.cube.total(months, [aggregate(edges)] if len(edges) else [])
+
+    def search(self, rows: pd.DataFrame, query) -> pd.DataFrame:
+        """rows whose merchant name or description contains query (normalized with
+        search_index.normalize_query)"""
+        matches = self.search_index.search(query)
+        is_match = np.zeros(len(rows), dtype=bool)
+        for col in SEARCH_COLUMNS:
+            is_match |= rows[col].isin(matches).to_numpy()
+        return rows[is_match]
+
+    def get_row(self, transaction_id) -> pd.Series:
+        """The current (overridden) row of a transaction"""
+        with self.lock:
+            return self.df.iloc[self.positions[transaction_id]]
+
+    def set_override(self, transaction_id, values: dict) -> None:
+        """Make values ({column: typed value}) the override layer of one transaction,
+        an empty dict removes its override"""
+        with self.lock:
+            if values:
+                self.overrides[transaction_id] = dict(values)
+            else:
+                self.overrides.pop(transaction_id, None)
+
+            position = self.positions.get(transaction_id)
+            if position is None:
+                return
+
+            # Cells no longer overridden go back to their base layer values
+            values = {col: v for col, v in values.items() if col in self.df}
+            base = self.base_values.pop(transaction_id, {})
+            cells = {col: value for col, value in base.items() if col not in values}
+            cells.update(values)
+            new_base = {
+                col: base.get(col, self.df[col].iat[position]) for col in values
+            }
+            if new_base:
+                self.base_values[transaction_id] = new_base
+            self._patch_row(position, cells)
+
+    def sync_overrides(self, overrides: dict) -> None:
+        """Patch in every transaction whose override differs from the given layer"""
+        with self.lock:
+            changed = [
+                transaction_id
+                for transaction_id in self.overrides.keys() | overrides.keys()
+                if self.overrides.get(transaction_id) != overrides.get(transaction_id)
+            ]
+            for transaction_id in changed:
+                self.set_override(transaction_id, overrides.get(transaction_id, {}))
+
+    def patch_override(self, transaction_id, amount=None, category=None) -> None:
+        """Patch in an edit made with overrides_helpers.upsert_override, amount in cents"""
+        with self.lock:
+            values = dict(self.overrides.get(transaction_id, {}))
+            if amount is not None:
+                values["amount"] = amount
+            if category is not None:
+                values["personal_finance_category.primary"] = category
+            self.set_override(transaction_id, values)
+
+    def clear_override(self, transaction_id) -> None:
+        """Patch in an edit made with overrides_helpers.delete_override"""
+        self.set_override(transaction_id, {})
+
+    def _patch_row(self, position, cells: dict) -> None:
+        label = self.df.index[position]
+        month_before = self.df["Month"].iat[position]
+        was_purchase = self.df["amount"].iat[position] > 0
+        if was_purchase:
+            self.cube.add(self.df.iloc[[position]], sign=-1)
+        if "date" in cells:
+            cells["Month"] = pd.Period(cells["date"], freq="M")
+        for col, value in cells.items():
+            set_column_values(self.df, col, [position], [value])
+        if cells.keys() & set(SEARCH_COLUMNS):
+            self.search_index.add(
+                str(cells[col]) for col in SEARCH_COLUMNS if col in cells
+            )
+        if cells.keys() & BUCKET_INPUTS:
+            cells[BUCKET_COL] = bucket_mask(self.df.iloc[[position]])[0]
+            set_column_values(self.df, BUCKET_COL, [position], [cells[BUCKET_COL]])
+        is_purchase = self.df["amount"].iat[position] > 0
+        if is_purchase:
+            self.cube.add(self.df.iloc[[position]])
+
+        if was_purchase and is_purchase and "date" not in cells:
+            purchase_position = self.purchases_df.index.get_loc(label)
+            for col in cells:
+                set_column_values(
+                    self.purchases_df,
+                    col,
+                    [purchase_position],
+                    [self.df[col].iat[position]],
+                )
+        else:
+            # Leaves, joins or moves within the date order
+            if was_purchase:
+                self._remove_purchase(label, month_before)
+            if is_purchase:
+                self._insert_purchase(position)
+
+        for month in {month_before, self.df["Month"].iat[position]}:
+            self.month_versions[month] = self.month_versions.get(month, 0) + 1
+        self.version += 1
+
+    def record_override_write(self, fingerprint_before, fingerprint_after) -> None:
+        """Call after writing an override that was also patched in with set_override
+
+        The fingerprints are the store's just before and after the write, taken
+        under its write lock (see overrides_helpers.upsert_override). If the store
+        was as last read before it, the write was the only change and the new
+        fingerprint is adopted so it doesn't cause a reload.
+        """
+        with self.lock:
+            if (
+                self.fingerprints is not None
+                and fingerprint_before == self.fingerprints[1]
+            ):
+                self.fingerprints = (self.fingerprints[0], fingerprint_after)
+
+
+def _month_data(df: pd.DataFrame) -> dict:
+    months = df[["Month", "Month_Name"]].drop_duplicates("Month").sort_values("Month")
+    month_names = months["Month_Name"].tolist()
+    return {
+        "month_names": month_names,
+        "month_by_name": dict(zip(month_names, months["Month"])),
+        "max_month": month_names[-1],
+    }
+
+
+def _month_slices(purchases_df: pd.DataFrame) -> dict:
+    """Month -> slice of purchases_df, which is sorted by date so by Month too"""
+    ordinals = purchases_df["Month"].array.asi8
+    month_ordinals, starts = np.unique(ordinals, return_index=True)
+    stops = np.append(starts[1:], len(ordinals))
+    return {
+        pd.Period(ordinal=ordinal, freq="M"): slice(start, stop)
+        for ordinal, start, stop in zip(month_ordinals, starts, stops)
+    }
+
+
+def _loaded_state(loaded, purchases_df=None) -> dict:
+    """TransactionData attributes for freshly loaded transactions"""
+    # Not part of the cached/published data, so changes to the rules apply
+    loaded.df[BUCKET_COL] = bucket_mask(loaded.df)
+    if purchases_df is None:
+        purchases_df = select_purchases(loaded.df)
+    else:
+        purchases_df[BUCKET_COL] = bucket_mask(purchases_df)
+    return {
+        "df": loaded.df,
+        "ingest_state": loaded.ingest_state,
+        "overrides": loaded.overrides,
+        "base_values": loaded.base_values,
+        "purchases_df": purchases_df,
+        "month_slices": _month_slices(purchases_df),
+        "cube": AggregateCube(purchases_df),
+        "search_index": build_search_index(loaded.df),
+        "positions": transaction_positions(loaded.df),
+        **_month_data(loaded.df),
+    }
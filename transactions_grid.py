@@ -0,0 +1,154 @@
+import pandas as pd
+from dash import dash_table
+from config import TRANSACTIONS_GRID_PAGE_SIZE
+from overrides_helpers import CATEGORY_COL
+
+# Grid column id -> purchases column
+GRID_COLUMNS = {
+    "date": "date",
+    "merchant": "merchant_name",
+    "amount": "amount",
+    "category": CATEGORY_COL,
+    "account": "account_id",
+}
+# Operators DataTable writes into filter_query, in the order they are checked
+FILTER_OPERATORS = [
+    ("ge", ">="),
+    ("le", "<="),
+    ("lt", "<"),
+    ("gt", ">"),
+    ("ne", "!="),
+    ("eq", "="),
+    ("contains",),
+    ("datestartswith",),
+]
+
+
+def create_transactions_grid():
+    """A DataTable that only receives the current page, sorted and filtered on
+    the server (see filter_and_sort_rows)"""
+    return dash_table.DataTable(
+        id="transactions-grid",
+        columns=[
+            {"name": "Date", "id": "date"},
+            {"name": "Merchant", "id": "merchant"},
+            {
+                "name": "Amount",
+                "id": "amount",
+                "type": "numeric",
+                "format": dash_table.FormatTemplate.money(2),
+            },
+            {"name": "Category", "id": "category"},
+            {"name": "Account", "id": "account"},
+            {"name": "", "id": "edit"},
+        ],
+        page_action="custom",
+        page_current=0,
+        page_size=TRANSACTIONS_GRID_PAGE_SIZE,
+        sort_action="custom",
+        sort_mode="single",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
+        # Only the visible rows of a page are rendered
+        virtualization=True,
+        fixed_rows={"headers": True},
+        style_table={"height": "500px", "overflowY": "auto"},
+        style_cell={"textAlign": "left", "padding": "12px", "minWidth": "90px"},
+        style_header={"fontWeight": "600", "color": "#4a5568"},
+        style_data_conditional=[
+            {
+                "if": {"column_id": "amount"},
+                "textAlign": "right",
+            },
+            {
+                "if": {"column_id": "edit"},
+                "color": "#4299e1",
+                "cursor": "pointer",
+            },
+        ],
+    )
+
+
+def _split_filter_part(filter_part):
+    """(column id, operator, value) of one clause of a DataTable filter_query"""
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if f" {operator} " in filter_part:
+                name_part, value_part = filter_part.split(f" {operator} ", 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+                value = value_part.strip()
+                if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"`":
+                    value = value[1:-1].replace("\\" + value[0], value[0])
+                return name, operator_type[0], value
+    return None, None, None
+
+
+def _filter_mask(rows: pd.DataFrame, name, operator, value) -> pd.Series:
+    values = rows[GRID_COLUMNS[name]]
+    if operator in ("contains", "datestartswith"):
+        if name == "date":
+            values = values.dt.strftime("%Y-%m-%d")
+        values = values.astype(str)
+        if operator == "datestartswith":
+            return values.str.startswith(value)
+        return values.str.contains(value, case=False, regex=False)
+    if name == "amount":
+        # Entered in dollars, stored in cents
+        value = round(float(value) * 100)
+    elif name == "date":
+        value = pd.Timestamp(value)
+    else:
+        values = values.astype(str)
+    return {
+        "ge": values >= value,
+        "le": values <= value,
+        "lt": values < value,
+        "gt": values > value,
+        "ne": values != value,
+        "eq": values == value,
+    }[operator]
+
+
+def filter_and_sort_rows(rows: pd.DataFrame, filter_query, sort_by) -> pd.DataFrame:
+    """Rows matching a DataTable filter_query, in sort_by order (or as given)
+
+    Clauses that can't be parsed are ignored rather than failing the table.
+    """
+    for filter_part in (filter_query or "").split(" && "):
+        name, operator, value = _split_filter_part(filter_part)
+        if name not in GRID_COLUMNS:
+            continue
+        try:
+            rows = rows[_filter_mask(rows, name, operator, value)]
+        except (ValueError, TypeError):
+            continue
+    if sort_by:
+        col = GRID_COLUMNS[sort_by[0]["column_id"]]
+        rows = rows.sort_values(
+            col,
+            ascending=sort_by[0]["direction"] == "asc",
+            kind="stable",
+            key=lambda values: (
+                values if col in ("date", "amount") else values.astype(str)
+            ),
+        )
+    return rows
+
+
+def grid_page(rows: pd.DataFrame, page) -> list:
+    """DataTable records of one page of rows, built a column at a time"""
+    start = page * TRANSACTIONS_GRID_PAGE_SIZE
+    rows = rows.iloc[start : start + TRANSACTIONS_GRID_PAGE_SIZE]
+    return pd.DataFrame(
+        {
+            # Row id, DataTable passes it back in active_cell
+            "id": rows["transaction_id"].to_numpy(),
+            "date": rows["date"].dt.strftime("%Y-%m-%d").to_numpy(),
+            "merchant": rows["merchant_name"].astype(str).to_numpy(),
+            "amount": rows["amount"].to_numpy() / 100,
+            "category": rows[CATEGORY_COL].astype(str).to_numpy(),
+            "account": rows["account_id"].astype(str).to_numpy(),
+            "edit": "Edit",
+        }
+    ).to_dict("records")
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from dash import Patch, no_update
+from plotly.colors import qualitative
+from config import CATEGORY_COLOR, TREEMAP_HOVER_TOP_N
+from overrides_helpers import CATEGORY_COL
+
+
+def _top_purchases(rows: pd.DataFrame, top_n: int) -> dict:
+    """(category, merchant) -> hover lines for its top_n largest purchases
+
+    Each of top_n passes takes the largest remaining purchase of every merchant,
+    so the cost is linear in rows rather than a sort of all of them.
+    """
+    groups = (
+        rows.groupby(
+            [CATEGORY_COL, "merchant_name"], observed=True, sort=False, dropna=False
+        )
+        .ngroup()
+        .to_numpy()
+    )
+    amounts = rows["amount"].to_numpy().astype("float64")
+    picked = []
+    for _ in range(top_n):
+        largest = np.full(groups.max(initial=-1) + 1, -np.inf)
+        np.maximum.at(largest, groups, amounts)
+        hits = np.flatnonzero((amounts == largest[groups]) & (amounts > -np.inf))
+        # The first of equal amounts, rows are newest first
+        _, first = np.unique(groups[hits], return_index=True)
+        picked.append(hits[first])
+        amounts[hits[first]] = -np.inf
+    top = rows.iloc[np.concatenate(picked)] if picked else rows.iloc[:0]
+    lines = {}
+    for category, merchant, name, amount, date in zip(
+        top[CATEGORY_COL].astype(str),
+        top["merchant_name"].astype(str),
+        top["name"],
+        top["amount"],
+        top["date"],
+    ):
+        lines.setdefault((category, merchant), []).append(
+            f"${amount / 100:,.2f} {name} ({date:%b %-d})"
+        )
+    return lines
+
+
+def build_treemap(agg: pd.DataFrame, rows: pd.DataFrame, top_n=TREEMAP_HOVER_TOP_N):
+    """Spend per merchant within each category, as a plain dict figure
+
+    Built straight from the aggregate (see aggregates.aggregate) rather than
+    with plotly express, and hover details are limited to the top_n largest
+    purchases (from rows) of each merchant, so the figure's size depends on the
+    number of merchants rather than transactions.
+    """
+    merchants = (
+        agg.groupby([CATEGORY_COL, "merchant_name"], sort=False)[["amount", "count"]]
+        .sum()
+        .reset_index()
+    )
+    merchants = merchants[merchants["amount"] > 0]
+    categories = (
+        merchants.groupby(CATEGORY_COL, sort=False)[["amount", "count"]]
+        .sum()
+        .reset_index()
+    )
+    colors = {
+        category: CATEGORY_COLOR.get(category, qualitative.Plotly[i % 10])
+        for i, category in enumerate(categories[CATEGORY_COL])
+    }
+    top_purchases = _top_purchases(rows, top_n)
+
+    ids, labels, parents, values, node_colors, customdata = [], [], [], [], [], []
+    for category, amount, count in categories.itertuples(index=False):
+        ids.append(category)
+        labels.append(category)
+        parents.append("")
+        # Category tiles are sized by their merchants (branchvalues="remainder")
+        values.append(0)
+        node_colors.append(colors[category])
+        customdata.append([f"{amount / 100:,.2f}", count, ""])
+    for category, merchant, amount, count in merchants.itertuples(index=False):
+        ids.append(f"{category}/{merchant}")
+        labels.append(merchant)
+        parents.append(category)
+        values.append(amount / 100)
+        node_colors.append(colors[category])
+        top = top_purchases.get((category, merchant), [])
+        customdata.append(
+            [f"{amount / 100:,.2f}", count, "".join("<br>" + line for line in top)]
+        )
+
+    chart = go.Figure(
+        go.Treemap(
+            ids=ids,
+            labels=labels,
+            parents=parents,
+            values=values,
+            branchvalues="remainder",
+            customdata=customdata,
+            hovertemplate="<b>%{label}</b><br>$%{customdata[0]}"
+            + "<br>%{customdata[1]} purchases%{customdata[2]}<extra></extra>",
+            marker=dict(
+                colors=node_colors,
+                cornerradius=8,
+                line=dict(width=2, color="white"),
+            ),
+            textfont=dict(size=16, color="black", family="Inter"),
+        )
+    )
+    chart.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        font=dict(family="Inter, sans-serif", size=14, color="#4a5568"),
+    )
+    return chart.to_dict()
+
+
+def patch_treemap(before: dict, after: dict):
+    """Update a figure made by build_treemap, sending only the tiles whose value
+    or hover changed
+
+    Returns a dash.Patch, dash.no_update if nothing changed, or after itself if
+    the tiles themselves changed (e.g. a merchant's first purchase in a category).
+    """
+    old, new = before["data"][0], after["data"][0]
+    if list(old["ids"]) != list(new["ids"]):
+        return after
+    figure = Patch()
+    changed = False
+    for key in ("values", "customdata"):
+        for i, (old_value, new_value) in enumerate(zip(old[key], new[key])):
+            if old_value != new_value:
+                figure["data"][0][key][i] = new_value
+                changed = True
+    return figure if changed else no_update
@@ -0,0 +1,60 @@
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+from config import CATEGORY_COLOR
+from overrides_helpers import CATEGORY_COL
+
+
+def build_trend(totals: pd.DataFrame, months: list, budgets: dict):
+    """Stacked spend per category for each of months, with a dashed line per budget
+
+    Built from AggregateCube.monthly_totals, so its cost depends on the number
+    of months and categories rather than transactions.
+    """
+    spend = (
+        totals.pivot_table(
+            index="Month",
+            columns=CATEGORY_COL,
+            values="amount",
+            aggfunc="sum",
+            fill_value=0,
+        ).reindex(months, fill_value=0)
+        / 100
+    )
+    labels = [month.strftime("%b %Y") for month in months]
+    # Biggest categories at the bottom of the stacks
+    categories = spend.sum().sort_values(ascending=False).index
+
+    chart = go.Figure()
+    for i, category in enumerate(categories):
+        chart.add_trace(
+            go.Bar(
+                x=labels,
+                y=spend[category].to_numpy(),
+                name=category,
+                marker_color=CATEGORY_COLOR.get(category, qualitative.Plotly[i % 10]),
+                hovertemplate=f"{category}<br>%{{x}}: $%{{y:,.2f}}<extra></extra>",
+            )
+        )
+    for name, amount in budgets.items():
+        chart.add_trace(
+            go.Scatter(
+                x=labels,
+                y=[amount] * len(labels),
+                name=f"{name} budget",
+                mode="lines",
+                line=dict(dash="dash", width=2),
+                hovertemplate=f"{name} budget: ${amount:,.2f}<extra></extra>",
+            )
+        )
+    chart.update_layout(
+        barmode="stack",
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        font=dict(family="Inter, sans-serif", size=14, color="#4a5568"),
+        yaxis=dict(tickprefix="$", gridcolor="#e2e8f0"),
+        legend=dict(orientation="h", y=-0.15),
+        hovermode="closest",
+    )
+    return chart.to_dict()
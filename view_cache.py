@@ -0,0 +1,44 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    """Thread-safe bounded cache that evicts the least recently used entry
+
+    Keys should include a data version (see TransactionData.data_version) so
+    entries computed from old data are never served and simply age out.
+    Cached values are shared between sessions and must not be mutated.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, calling compute() to fill it on a miss"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            # Computed outside the lock, two threads may both compute a missing key
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()